@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional
-from sqlalchemy import and_, or_
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from App.dal.calendar import get_db
-from App.dal.calendar import get_agent_events
+from App import config
+from App.dal.calendar import event_to_dict, get_agent_events, get_next_free_windows, iter_agent_events, query_agent_events
+from App.free_time import clip_gaps, free_gaps, slots_from_gaps
+from App.api.change_feed import Subscription, change_feed, format_sse, replay_changes
+from App.dal.snapshot import get_snapshot_reader
 # Create the router with a prefix
 agent_schedule_router = APIRouter(
     prefix="/agent-schedule",   
@@ -27,47 +30,30 @@ async def check_availability(client_id: str,
         duration_minutes: Duration of the requested slot in minutes
     
     Returns:
-        Dict containing availability status and any conflicts
+        Dict containing availability status and any conflicts, one per
+        overlapping event ordered by start and end time
     """
     try:
         # Calculate end time
         end_time = start_time + timedelta(minutes=duration_minutes)
         
-        db = get_db()
-        query = db.query(CalendarEvent).filter(
-            and_(
-                CalendarEvent.client_id == client_id,
-                CalendarEvent.agent_id == agent_id,
-                or_(
-                    # Event starts during requested slot
-                    and_(
-                        CalendarEvent.start_time >= start_time,
-                        CalendarEvent.start_time < end_time
-                    ),
-                    # Event ends during requested slot
-                    and_(
-                        CalendarEvent.end_time > start_time,
-                        CalendarEvent.end_time <= end_time
-                    ),
-                    # Event encompasses requested slot
-                    and_(
-                        CalendarEvent.start_time <= start_time,
-                        CalendarEvent.end_time >= end_time
-                    )
-                )
-            )
-        )
-        
-        conflicts = query.order_by(CalendarEvent.start_time.asc()).all()
-        if conflicts:
+        # Answer from the shared snapshot when it covers the slot, else query the DB
+        snapshot = get_snapshot_reader()
+        busy = snapshot.busy_intervals(client_id, agent_id, start_time, end_time) if snapshot else None
+        if busy is None:
+            # Any event overlapping the requested slot is a conflict; ordered like the snapshot.
+            # DB errors must not report the slot as free, so they reach the error response below
+            busy = sorted((event.start_time, event.end_time)
+                          for event in query_agent_events(client_id, agent_id, start_time, end_time))
+        if busy:
             return {
                 "available": False,
                 "reason": "Time slot conflicts with existing appointments",
                 "conflicts": [
                     {
-                        "start": event.start_time,
-                        "end": event.end_time,
-                    } for event in conflicts
+                        "start": start,
+                        "end": end,
+                    } for start, end in busy
                 ]
             }
             
@@ -163,8 +149,24 @@ async def find_available_timeslots(client_id: str,
     
     Returns:
     - available_slots: List of available time slots
+    - earliest_slot: Start of the first available slot
+    - events: Events in the searched range; omitted when "next slots from now" is answered
+      from the precomputed windows
     """
     try:
+        # "Next slots from now" for a standard duration is answered from the table the sync job maintains
+        if (config.NEXT_SLOTS_ENABLED and start_time is None and end_time is None
+                and duration_minutes in config.NEXT_SLOTS_DURATIONS):
+            now = datetime.now(timezone.utc)
+            windows = get_next_free_windows(client_id, agent_id, duration_minutes)
+            available_slots = slots_from_gaps(windows, duration_minutes, num_slots, now)
+            if len(available_slots) == num_slots:
+                # No "events": fetching them would cost the per-request events query this path avoids
+                return {
+                    "available_slots": available_slots,
+                    "earliest_slot": available_slots[0]["start"]
+                }
+
         # Get all events for the agent
         if start_time is None:
             start_time = datetime.now(timezone.utc)
@@ -203,6 +205,84 @@ async def find_available_timeslots(client_id: str,
             "error": str(e)
         }
 
+# Bounds on one batch request: durations x windows result sets of up to num_slots slots each
+BATCH_MAX_DURATIONS = 10
+BATCH_MAX_WINDOWS = 20
+BATCH_MAX_SLOTS = 50
+# Events are fetched once from the earliest window start to the latest window end
+BATCH_MAX_SPAN = timedelta(days=31)
+
+def parse_window(window: str):
+    """Parse an ISO 8601 interval "start/end" into UTC datetimes"""
+    try:
+        start, end = (datetime.fromisoformat(part.strip()) for part in window.split("/"))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid window '{window}', expected 'start/end' in ISO 8601")
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    if end <= start:
+        raise HTTPException(status_code=422, detail=f"Invalid window '{window}', end must be after start")
+    return start, end
+
+@agent_schedule_router.get("/find-available-timeslots/batch")
+async def find_available_timeslots_batch(client_id: str,
+    agent_id: str,
+    durations: List[int] = Query([30], max_length=BATCH_MAX_DURATIONS),
+    windows: Optional[List[str]] = Query(None, max_length=BATCH_MAX_WINDOWS),
+    num_slots: int = Query(3, gt=0, le=BATCH_MAX_SLOTS)):
+    """
+    Find available time slots for several durations and time windows at once
+    
+    Parameters:
+    - client_id: Unique identifier for the client
+    - agent_id: Unique identifier for the agent
+    - durations: Meeting durations in minutes, repeatable, at most 10 (default: 30)
+    - windows: Time windows as ISO 8601 "start/end" intervals, repeatable, at most 20,
+      all within 31 days of the earliest start (default: now to 2 days from now)
+    - num_slots: Number of available slots to return per window and duration, 1 to 50 (default: 3)
+    
+    Returns:
+    - results: Available slots for every window and duration combination
+    """
+    if any(duration_minutes <= 0 for duration_minutes in durations):
+        raise HTTPException(status_code=422, detail="durations must be positive")
+    if windows:
+        parsed_windows = [parse_window(window) for window in windows]
+    else:
+        now = datetime.now(timezone.utc)
+        parsed_windows = [(now, now + timedelta(days=2))]
+    range_start = min(start for start, _ in parsed_windows)
+    range_end = max(end for _, end in parsed_windows)
+    if range_end - range_start > BATCH_MAX_SPAN:
+        raise HTTPException(status_code=422,
+                            detail=f"windows must span at most {BATCH_MAX_SPAN.days} days in total")
+
+    try:
+        # Query events and compute free gaps once over the union of all windows
+        events = query_agent_events(client_id, agent_id, range_start, range_end)
+        gaps = free_gaps([(event.start_time, event.end_time) for event in events], range_start, range_end)
+
+        results = []
+        for start, end in parsed_windows:
+            window_gaps = clip_gaps(gaps, start, end)
+            for duration_minutes in durations:
+                results.append({
+                    "start_time": start,
+                    "end_time": end,
+                    "duration_minutes": duration_minutes,
+                    "available_slots": slots_from_gaps(window_gaps, duration_minutes, num_slots)
+                })
+        return {
+            "results": results
+        }
+
+    except Exception as e:
+        return {
+            "available": False,
+            "reason": "Internal error checking availability",
+            "error": str(e)
+        }
+
 # TODO: need to support local timezone later.
 @agent_schedule_router.get("/check-day-utilization")
 async def check_day_utilization(client_id: str,
@@ -226,10 +306,15 @@ async def check_day_utilization(client_id: str,
         if start_time is None:
             start_time = datetime.now(timezone.utc)
 
+        # Fetch the whole range once; history older than the retention period comes from the archive
+        range_events = get_agent_events(client_id, agent_id, start_time, start_time + timedelta(days=days),
+                                        include_archive=True)
+
         utilization_list = []
         for i in range(days):
             end_time = start_time + timedelta(days=1)
-            events = get_agent_events(client_id, agent_id, start_time, end_time)
+            events = [event for event in range_events
+                      if event.start_time < end_time and event.end_time > start_time]
             # Calculate total utilization for the day
             total_utilization = 0
             for event in events:
@@ -257,6 +342,91 @@ async def check_day_utilization(client_id: str,
         }
     
 
+@agent_schedule_router.get("/changes/stream")
+async def stream_availability_changes(request: Request,
+    client_id: str,
+    agent_ids: List[str] = Query(...),
+    start_time: datetime = None,
+    end_time: datetime = None,
+    since_id: int = None):
+    """
+    Stream availability changes for a set of agents as server-sent events
+    
+    Parameters:
+    - client_id: Unique identifier for the client
+    - agent_ids: Agents to watch, repeatable
+    - start_time: Only send changes affecting time after this (optional)
+    - end_time: Only send changes affecting time before this (optional)
+    - since_id: Replay changes after this change id first; the Last-Event-ID
+      header sent by reconnecting EventSource clients is used when omitted
+    
+    Returns:
+    - text/event-stream of "change" events with the affected agent and time range
+    """
+    if since_id is None and request.headers.get("last-event-id", "").isdigit():
+        since_id = int(request.headers["last-event-id"])
+    if start_time is not None and start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    if end_time is not None and end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=timezone.utc)
+
+    subscription = Subscription(client_id, agent_ids, start_time, end_time)
+    # Subscribe before replaying: the feed sends everything after live_from, replay covers up to it
+    live_from = await change_feed.subscribe(subscription)
+
+    async def events():
+        try:
+            if since_id is not None:
+                async for change in replay_changes(subscription, since_id, live_from):
+                    subscription.last_id = change.id
+                    yield format_sse(change)
+
+            while not await request.is_disconnected():
+                try:
+                    change = await asyncio.wait_for(subscription.queue.get(), timeout=config.CHANGE_FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if change is None:
+                    break
+                if change.id <= subscription.last_id:
+                    continue
+                subscription.last_id = change.id
+                yield format_sse(change)
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@agent_schedule_router.get("/export")
+async def export_schedules(client_id: str,
+    agent_ids: Optional[List[str]] = Query(None),
+    start_time: datetime = None,
+    end_time: datetime = None):
+    """
+    Export events as newline-delimited JSON, streamed with constant memory
+    
+    Parameters:
+    - client_id: Unique identifier for the client
+    - agent_ids: Agents to export, repeatable (default: all agents of the client)
+    - start_time: Start of the range (default: now)
+    - end_time: End of the range (default: 7 days after start_time)
+    
+    Returns:
+    - application/x-ndjson, one event per line ordered by agent and start time
+    """
+    if start_time is None:
+        start_time = datetime.now(timezone.utc)
+    if end_time is None:
+        end_time = start_time + timedelta(days=7)
+
+    def lines():
+        for batch in iter_agent_events(client_id, agent_ids, start_time, end_time, config.EXPORT_BATCH_SIZE):
+            yield "".join(json.dumps(event_to_dict(row)) + "\n" for row in batch)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 # test endpoint
 @agent_schedule_router.get("/")
 async def get_schedules(client_id: str, agent_id: str, start_time: datetime = None, end_time: datetime = None):
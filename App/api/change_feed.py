@@ -0,0 +1,157 @@
+"""
+Fan-out of calendar change log records to streaming subscribers.
+
+Each API process runs a single poller while at least one client is
+subscribed. It reads new change log records with one indexed query per
+interval, however many clients are connected, and hands each subscriber only
+the changes for its agents that overlap its watched window.
+
+Change ids come from a sequence assigned at insert time, so with concurrent
+writers (Postgres) a lower id can commit after a higher one. The poller
+delivers ids in order and stops at a missing id until it commits or
+gap_seconds pass (rolled back transactions leave permanent gaps).
+"""
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+from App import config
+from App.dal.calendar import get_changes_since, get_latest_change_id
+
+# Changes buffered per subscriber before it is dropped; clients resume with Last-Event-ID
+SUBSCRIPTION_QUEUE_SIZE = 1000
+
+
+def change_to_dict(change) -> dict:
+    return {
+        "id": change.id,
+        "client_id": change.client_id,
+        "agent_id": change.agent_id,
+        "calendar_id": change.calendar_id,
+        "change_type": change.change_type,
+        "start": change.range_start.isoformat() if change.range_start else None,
+        "end": change.range_end.isoformat() if change.range_end else None,
+        "created_at": change.created_at.isoformat() if change.created_at else None,
+    }
+
+
+def format_sse(change) -> str:
+    """Server-sent event for a change; the id lets clients resume after reconnecting"""
+    return f"id: {change.id}\nevent: change\ndata: {json.dumps(change_to_dict(change))}\n\n"
+
+
+class Subscription:
+    def __init__(self, client_id: str, agent_ids: Iterable[str],
+                 start_time: Optional[datetime] = None, end_time: Optional[datetime] = None):
+        self.client_id = client_id
+        self.agent_ids = set(agent_ids)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+        # Highest change id delivered, to skip duplicates between replay and live changes
+        self.last_id = 0
+        self.overflowed = False
+
+    def matches(self, change) -> bool:
+        if change.client_id != self.client_id or change.agent_id not in self.agent_ids:
+            return False
+        if self.start_time is not None and change.range_end is not None and change.range_end <= self.start_time:
+            return False
+        if self.end_time is not None and change.range_start is not None and change.range_start >= self.end_time:
+            return False
+        return True
+
+    def put(self, change) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # Too slow to keep up; end the stream so the client reconnects and replays
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class ChangeFeed:
+    def __init__(self, poll_seconds: float, gap_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.gap_seconds = gap_seconds
+        self.subscriptions = set()
+        # Every id up to last_id has been delivered or given up on
+        self.last_id = 0
+        self._gap_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    async def subscribe(self, subscription: Subscription) -> int:
+        """
+        Add a subscription; it receives every change after the returned id,
+        so replay up to that id to resume without gaps or duplicates
+        """
+        self.subscriptions.add(subscription)
+        if self._task is None or self._task.done():
+            # Set before awaiting so subscribers arriving together share one poller
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._poll())
+        try:
+            await self._ready.wait()
+            if self._task.done():
+                # Raise the error that stopped the poller from starting
+                self._task.result()
+        except BaseException:
+            self.unsubscribe(subscription)
+            raise
+        return self.last_id
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+
+    def deliver(self, changes, now: float) -> None:
+        """Hand changes after last_id to matching subscribers in id order, holding at gaps"""
+        for change in changes:
+            if change.id <= self.last_id:
+                continue
+            if change.id != self.last_id + 1:
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < self.gap_seconds:
+                    return
+            for subscription in list(self.subscriptions):
+                if subscription.matches(change):
+                    subscription.put(change)
+            self.last_id = change.id
+            self._gap_since = None
+
+    async def _poll(self) -> None:
+        try:
+            self.last_id = await asyncio.to_thread(get_latest_change_id, self.gap_seconds)
+        finally:
+            self._ready.set()
+        while self.subscriptions:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                changes = await asyncio.to_thread(get_changes_since, self.last_id)
+            except Exception as e:
+                print(f"Error polling change log: {str(e)}")
+                continue
+            self.deliver(changes, time.monotonic())
+
+
+change_feed = ChangeFeed(config.CHANGE_FEED_POLL_SECONDS, config.CHANGE_FEED_GAP_SECONDS)
+
+
+async def replay_changes(subscription: Subscription, since_id: int, until_id: int, batch_size: int = 1000):
+    """Yield logged changes in (since_id, until_id] that match the subscription, oldest first"""
+    while since_id < until_id:
+        changes = await asyncio.to_thread(
+            get_changes_since, since_id, subscription.client_id, subscription.agent_ids, batch_size)
+        for change in changes:
+            if change.id > until_id:
+                return
+            if subscription.matches(change):
+                yield change
+        if len(changes) < batch_size:
+            return
+        since_id = changes[-1].id
@@ -0,0 +1,358 @@
+"""
+Load-test harness for the agent schedule API.
+
+Drives the /api/v1/agent-schedule/* endpoints with a configurable request mix
+and concurrency, either in-process through the ASGI transport or against a
+running uvicorn server, and reports per-endpoint latency percentiles and RPS.
+
+Examples:
+    python App/bench/loadgen.py --seed --requests 2000 --concurrency 32
+    python App/bench/loadgen.py --base-url http://localhost:8000 --duration 30
+    python App/bench/loadgen.py --output after.json --compare before.json
+"""
+import sys
+import os
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+# Get the absolute path to the project root
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+
+# Add project root to Python path
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import httpx
+
+API_PREFIX = "/api/v1/agent-schedule"
+SEED_CLIENT_ID = "loadtest"
+# Seeded days start today, so requests fall inside the schedule snapshot and precomputed next-slot horizons
+SEED_START = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+# Seed and serve from a scratch DB so load tests never write to the real calendar DB
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "housewhisper-loadtest.db")
+
+DEFAULT_MIX = "check-availability=5,find-available-timeslots=2,next-slots=2,check-day-utilization=1,schedules=1"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Linearly interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """Parse 'endpoint=weight,...' into a dict of weights"""
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}. Choose from {', '.join(ENDPOINTS)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def random_start(rng: random.Random, days: int) -> str:
+    minutes = rng.randrange(0, days * 24 * 60, 15)
+    return (SEED_START + timedelta(minutes=minutes)).isoformat()
+
+
+def check_availability_params(rng, agent_id, days):
+    return "/check-availability", {
+        "start_time": random_start(rng, days),
+        "duration_minutes": rng.choice([15, 30, 60]),
+    }
+
+
+def find_available_timeslots_params(rng, agent_id, days):
+    return "/find-available-timeslots", {
+        "start_time": random_start(rng, days),
+        "duration_minutes": rng.choice([15, 30, 60]),
+        "num_slots": 3,
+    }
+
+
+def next_slots_params(rng, agent_id, days):
+    # No start/end time: "next slots from now" for a standard duration
+    return "/find-available-timeslots", {
+        "duration_minutes": rng.choice([15, 30, 60]),
+        "num_slots": 3,
+    }
+
+
+def find_available_timeslots_batch_params(rng, agent_id, days):
+    windows = []
+    first = datetime.fromisoformat(random_start(rng, days))
+    for _ in range(3):
+        # Within a week of each other, well inside the batch endpoint's span limit
+        start = first + timedelta(days=rng.randrange(0, 7))
+        windows.append(f"{start.isoformat()}/{(start + timedelta(days=1)).isoformat()}")
+    return "/find-available-timeslots/batch", {
+        "durations": [15, 30, 60],
+        "windows": windows,
+        "num_slots": 3,
+    }
+
+
+def check_day_utilization_params(rng, agent_id, days):
+    return "/check-day-utilization", {
+        "start_time": random_start(rng, days),
+        "days": rng.choice([1, 7]),
+    }
+
+
+def schedules_params(rng, agent_id, days):
+    return "/", {"start_time": random_start(rng, days)}
+
+
+ENDPOINTS = {
+    "check-availability": check_availability_params,
+    "find-available-timeslots": find_available_timeslots_params,
+    "next-slots": next_slots_params,
+    "find-available-timeslots-batch": find_available_timeslots_batch_params,
+    "check-day-utilization": check_day_utilization_params,
+    "schedules": schedules_params,
+}
+
+
+def seed_db(num_agents: int, events_per_day: int, days: int, rng: random.Random) -> None:
+    """Replace the load-test client's events with a synthetic schedule and precompute what the API serves from"""
+    from App.dal.calendar import (
+        get_db, load_partitions, partition_for, partition_model, CalendarChange,
+        publish_schedule_snapshot, refresh_next_slots
+    )
+
+    session = get_db()
+    partitions = load_partitions(session)
+    for partition in partitions.values():
+        if partition.archive_path is None:
+            model = partition_model(partition.month_start)
+            session.query(model).filter(model.client_id == SEED_CLIENT_ID).delete()
+    events = []
+    for agent in range(num_agents):
+        agent_id = f"agent-{agent}"
+        for day in range(days):
+            day_start = SEED_START + timedelta(days=day, hours=9)
+            for i in range(events_per_day):
+                start_time = day_start + timedelta(minutes=rng.randrange(0, 8 * 60, 15))
+                end_time = start_time + timedelta(minutes=rng.choice([15, 30, 60, 90]))
+                model = partition_for(session, partitions, start_time, end_time)
+                if model is None:
+                    continue
+                events.append(model(
+                    calendar_id=f"{SEED_CLIENT_ID}-{agent_id}-{day}-{i}",
+                    client_id=SEED_CLIENT_ID,
+                    agent_id=agent_id,
+                    summary="load test event",
+                    description="",
+                    start_time=start_time,
+                    end_time=end_time,
+                ))
+    session.add_all(events)
+    # One change record per agent marks published schedule snapshots stale
+    seeded_at = datetime.now(timezone.utc)
+    session.add_all(CalendarChange(
+        client_id=SEED_CLIENT_ID,
+        agent_id=f"agent-{agent}",
+        calendar_id=None,
+        change_type="seeded",
+        range_start=SEED_START,
+        range_end=SEED_START + timedelta(days=days + 1),
+        created_at=seeded_at
+    ) for agent in range(num_agents))
+    session.commit()
+    print(f"Seeded {len(events)} events for {num_agents} agents over {days} days")
+
+    # What the sync job would maintain after a merge
+    for agent in range(num_agents):
+        refresh_next_slots(SEED_CLIENT_ID, f"agent-{agent}")
+    publish_schedule_snapshot()
+
+
+async def run_load(client: httpx.AsyncClient, args, weights: Dict[str, int]) -> Dict[str, dict]:
+    rng = random.Random(args.random_seed)
+    names = list(weights)
+    name_weights = [weights[name] for name in names]
+    samples = {name: {"latencies": [], "errors": 0, "statuses": {}} for name in names}
+
+    sent = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_request():
+        nonlocal sent
+        if deadline is not None:
+            if time.perf_counter() >= deadline:
+                return None
+        elif sent >= args.requests:
+            return None
+        sent += 1
+        name = rng.choices(names, name_weights)[0]
+        agent_id = f"agent-{rng.randrange(args.agents)}"
+        path, params = ENDPOINTS[name](rng, agent_id, args.days)
+        params.update({"client_id": SEED_CLIENT_ID, "agent_id": agent_id})
+        return name, path, params
+
+    async def worker():
+        while True:
+            request = next_request()
+            if request is None:
+                return
+            name, path, params = request
+            started = time.perf_counter()
+            try:
+                response = await client.get(API_PREFIX + path, params=params)
+                elapsed = time.perf_counter() - started
+                status = str(response.status_code)
+                # Handlers report internal errors in the body with a 200 status
+                failed = response.status_code >= 400 or "error" in response.json()
+            except Exception:
+                elapsed = time.perf_counter() - started
+                status = "exception"
+                failed = True
+            stats = samples[name]
+            stats["latencies"].append(elapsed)
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            if failed:
+                stats["errors"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall_time = time.perf_counter() - started
+    return summarize(samples, wall_time)
+
+
+def summarize(samples: Dict[str, dict], wall_time: float) -> Dict[str, dict]:
+    """Reduce raw latency samples to per-endpoint and overall statistics (ms)"""
+    results = {}
+    all_latencies = []
+    total_errors = 0
+    for name, stats in samples.items():
+        latencies = sorted(stats["latencies"])
+        all_latencies.extend(latencies)
+        total_errors += stats["errors"]
+        results[name] = endpoint_summary(latencies, stats["errors"], wall_time)
+        results[name]["statuses"] = stats["statuses"]
+    results["overall"] = endpoint_summary(sorted(all_latencies), total_errors, wall_time)
+    return results
+
+
+def endpoint_summary(latencies: List[float], errors: int, wall_time: float) -> dict:
+    count = len(latencies)
+    return {
+        "count": count,
+        "errors": errors,
+        "rps": round(count / wall_time, 2) if wall_time else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+def print_report(results: Dict[str, dict], baseline: Optional[dict] = None) -> None:
+    header = f"{'endpoint':<32}{'count':>8}{'errors':>8}{'rps':>10}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in results.items():
+        print(f"{name:<32}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>10.1f}"
+              f"{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    if baseline is None:
+        return
+
+    print("\nCompared to baseline (positive latency delta = slower):")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        print(f"{name:<32}"
+              f"p50 {delta(stats['p50_ms'], old['p50_ms']):>9}  "
+              f"p99 {delta(stats['p99_ms'], old['p99_ms']):>9}  "
+              f"rps {delta(stats['rps'], old['rps']):>9}")
+
+
+def delta(new: float, old: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+async def main_async(args) -> Dict[str, dict]:
+    weights = parse_mix(args.mix)
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from App.router import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                   base_url="http://loadgen", timeout=args.timeout)
+    async with client:
+        if args.warmup:
+            warmup_args = argparse.Namespace(**{**vars(args), "requests": args.warmup, "duration": None})
+            await run_load(client, warmup_args, weights)
+        return await run_load(client, args, weights)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the agent schedule API")
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process ASGI app")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests to send")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed request count")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--warmup", type=int, default=50, help="Requests to send before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted request mix, e.g. check-availability=5,schedules=1")
+    parser.add_argument("--agents", type=int, default=20, help="Number of seeded agents to spread requests over")
+    parser.add_argument("--days", type=int, default=30, help="Number of seeded days to pick start times from")
+    parser.add_argument("--db-path", default=os.environ.get("CALENDAR_DB_PATH", DEFAULT_DB_PATH),
+                        help="SQLite DB to seed and serve in-process; start the server with the same "
+                             "CALENDAR_DB_PATH when using --base-url")
+    parser.add_argument("--seed", action="store_true", help="(Re)seed the database with synthetic events first")
+    parser.add_argument("--events-per-day", type=int, default=6, help="Events per agent per day when seeding")
+    parser.add_argument("--random-seed", type=int, default=42, help="Seed for the request generator")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    # App.config reads these at import, so set them before anything from App is imported
+    os.environ["CALENDAR_DB_PATH"] = args.db_path
+    os.environ.setdefault("SNAPSHOT_PATH", f"{args.db_path}.snapshot")
+
+    if args.seed:
+        seed_db(args.agents, args.events_per_day, args.days, random.Random(args.random_seed))
+
+    results = asyncio.run(main_async(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "target": args.base_url or "asgi",
+                "concurrency": args.concurrency,
+                "mix": args.mix,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
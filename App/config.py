@@ -0,0 +1,87 @@
+"""
+Runtime settings, read from environment variables.
+"""
+import os
+import tempfile
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Profiling
+# Allow per-request profiling via the X-Profile header or ?profile= query flag
+PROFILING_ENABLED = _env_bool("PROFILING_ENABLED")
+# Continuously profile 1 in N requests (0 disables)
+PROFILE_SAMPLE_EVERY = int(os.environ.get("PROFILE_SAMPLE_EVERY", "0"))
+# Stack sampling interval for explicitly profiled requests
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "1"))
+# Coarser sampling interval for continuous 1-in-N profiling to keep overhead low
+PROFILE_CONTINUOUS_INTERVAL_MS = float(os.environ.get("PROFILE_CONTINUOUS_INTERVAL_MS", "10"))
+# Where explicitly profiled requests are stored as folded stacks
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "housewhisper-profiles"))
+
+# Calendar database
+DATABASE_PATH = os.environ.get(
+    "CALENDAR_DB_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "dal", "calendar.db")))
+# SQLAlchemy URL; sqlite:/// (default, using DATABASE_PATH) or postgresql://
+DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DATABASE_PATH}")
+# Connection pool for server databases (Postgres)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+# SQLite tuning, applied to every pooled connection
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are KiB, positive values are pages (SQLite convention)
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Read-only connections shared by API reads; writes go through a single writer connection
+SQLITE_READER_POOL_SIZE = int(os.environ.get("SQLITE_READER_POOL_SIZE", "4"))
+SQLITE_POOL_TIMEOUT = float(os.environ.get("SQLITE_POOL_TIMEOUT", "30"))
+
+# Shared schedule snapshot published by the sync job and mapped by API workers
+SNAPSHOT_PATH = os.environ.get(
+    "SNAPSHOT_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "dal", "calendar.snapshot")))
+SNAPSHOT_ENABLED = _env_bool("SNAPSHOT_ENABLED", True)
+# Busy intervals are published from one day back to this many days ahead
+SNAPSHOT_HORIZON_DAYS = int(os.environ.get("SNAPSHOT_HORIZON_DAYS", "60"))
+# Republish at least this often so the horizon keeps moving between syncs
+SNAPSHOT_REFRESH_MINUTES = int(os.environ.get("SNAPSHOT_REFRESH_MINUTES", "60"))
+# Ignore a snapshot older than this, e.g. when the sync job has stopped (0 disables)
+SNAPSHOT_MAX_AGE_SECONDS = int(os.environ.get("SNAPSHOT_MAX_AGE_SECONDS", str(24 * 60 * 60)))
+
+# Precomputed "next free slots" maintained by the sync job
+NEXT_SLOTS_ENABLED = _env_bool("NEXT_SLOTS_ENABLED", True)
+# Standard meeting durations (minutes) answered from the precomputed table
+NEXT_SLOTS_DURATIONS = [int(d) for d in os.environ.get("NEXT_SLOTS_DURATIONS", "15,30,60").split(",") if d.strip()]
+# Keep enough free windows for at least this many slots per duration
+NEXT_SLOTS_COUNT = int(os.environ.get("NEXT_SLOTS_COUNT", "10"))
+NEXT_SLOTS_HORIZON_DAYS = int(os.environ.get("NEXT_SLOTS_HORIZON_DAYS", "14"))
+
+# Availability change notifications
+# How often each API process polls the change log while clients are subscribed
+CHANGE_FEED_POLL_SECONDS = float(os.environ.get("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_KEEPALIVE_SECONDS = float(os.environ.get("CHANGE_FEED_KEEPALIVE_SECONDS", "15"))
+# Change ids are assigned at insert, not commit: wait this long for a missing lower id
+# to commit before skipping it (it may have been rolled back)
+CHANGE_FEED_GAP_SECONDS = float(os.environ.get("CHANGE_FEED_GAP_SECONDS", "10"))
+
+# Rows fetched per round trip by streaming exports
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+# Events are stored in one table per month of start time. Months that ended more than
+# this many months ago are moved to compressed archives by the sync job (0 disables)
+EVENT_RETENTION_MONTHS = int(os.environ.get("EVENT_RETENTION_MONTHS", "12"))
+EVENT_ARCHIVE_DIR = os.environ.get(
+    "EVENT_ARCHIVE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "dal", "archive")))
+# How often the sync job looks for partitions to archive
+EVENT_ARCHIVE_INTERVAL_HOURS = int(os.environ.get("EVENT_ARCHIVE_INTERVAL_HOURS", "24"))
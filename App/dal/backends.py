@@ -0,0 +1,90 @@
+"""
+Storage backends for the calendar DAL.
+
+A backend knows how to create engines for its database URL, any schema
+additions beyond the portable ORM tables (for the database and for each
+monthly event partition), and how to express the time-range overlap
+predicate used by event lookups.
+"""
+from datetime import datetime
+from typing import Tuple
+from sqlalchemy import text, func, literal, literal_column
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from App.dal.engine import create_sqlite_engines, create_postgres_engines
+
+
+class SQLiteBackend:
+    name = "sqlite"
+    # INSERT supporting ON CONFLICT DO NOTHING
+    insert = staticmethod(sqlite.insert)
+
+    def create_engines(self, db_url: str) -> Tuple[Engine, Engine]:
+        return create_sqlite_engines(make_url(db_url).database)
+
+    def setup_schema(self, engine: Engine) -> None:
+        pass
+
+    def setup_partition(self, connection: Connection, table_name: str) -> None:
+        pass
+
+    def lock_partition(self, connection: Connection, table_name: str) -> None:
+        """Serialize creating a partition; SQLite already allows one writer at a time"""
+        pass
+
+    def overlap_clause(self, model, start_time: datetime, end_time: datetime):
+        """Events overlapping [start_time, end_time), served by the start/end indexes"""
+        return (model.start_time < end_time) & (model.end_time > start_time)
+
+
+class PostgresBackend:
+    """
+    Adds a generated tstzrange column with a GiST index to each event partition
+    so overlap lookups are answered by the range index instead of two B-tree
+    range scans.
+    """
+    name = "postgresql"
+    insert = staticmethod(postgresql.insert)
+
+    def create_engines(self, db_url: str) -> Tuple[Engine, Engine]:
+        return create_postgres_engines(db_url)
+
+    def setup_schema(self, engine: Engine) -> None:
+        with engine.begin() as conn:
+            # btree_gist lets client_id/agent_id equality share the GiST index with the range
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
+    def setup_partition(self, connection: Connection, table_name: str) -> None:
+        connection.execute(text(
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS during tstzrange "
+            "GENERATED ALWAYS AS (tstzrange(start_time, greatest(start_time, end_time), '[)')) STORED"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{table_name}_during "
+            f"ON {table_name} USING gist (client_id, agent_id, during)"
+        ))
+
+    def lock_partition(self, connection: Connection, table_name: str) -> None:
+        """Serialize concurrent merges creating the same partition until the transaction ends"""
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": table_name})
+
+    def overlap_clause(self, model, start_time: datetime, end_time: datetime):
+        during = literal_column(f"{model.__tablename__}.during")
+        # Bind as timestamptz (normalized to UTC) so the range isn't built in the session timezone
+        start = literal(start_time, model.start_time.type)
+        end = literal(end_time, model.end_time.type)
+        return during.op("&&")(func.tstzrange(start, end, literal_column("'[)'")))
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend(db_url: str):
+    """Backend for a SQLAlchemy URL, e.g. sqlite:///calendar.db or postgresql+psycopg2://..."""
+    backend_name = make_url(db_url).get_backend_name()
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unsupported database backend: {backend_name}")
+    return BACKENDS[backend_name]()
@@ -1,195 +1,807 @@
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Index
+from sqlalchemy import Column, Integer, String, DateTime, Index, MetaData, Table, inspect, select, union_all, tuple_, literal, update, case
+from sqlalchemy.event import listen
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime, timezone, date
+from sqlalchemy.orm import sessionmaker, scoped_session, declared_attr
+from datetime import datetime, timezone, date, timedelta
 from sqlalchemy.types import TypeDecorator  
+import gzip
+import json
 import os
+import threading
+import time
 from icalendar import Calendar
+from App import config, metrics
+from App.dal.backends import get_backend
+from App.dal.snapshot import write_snapshot
+from App.free_time import free_gaps
 # Initialize SQLAlchemy
 Base = declarative_base()
 
+def to_utc(value):
+    """Convert a date or datetime to an aware UTC datetime, treating naive values as UTC"""
+    if value is None:
+        return None
+
+    # Convert date to datetime if necessary
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+
+    # Now handle timezone
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
 class UTCDateTime(TypeDecorator):
     """Automatically convert naive datetime to UTC and store with timezone info"""
     impl = DateTime(timezone=True)
     cache_ok = True
     def process_bind_param(self, value, dialect):
-        if value is None:
-            return None
-            
-        # Convert date to datetime if necessary
-        if isinstance(value, date) and not isinstance(value, datetime):
-            value = datetime.combine(value, datetime.min.time())
-            
-        # Now handle timezone
-        if value.tzinfo is None:
-            return value.replace(tzinfo=timezone.utc)
-        return value.astimezone(timezone.utc)
+        return to_utc(value)
 
     def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return value.replace(tzinfo=timezone.utc)
+        # Postgres returns timestamptz in the session's TimeZone; convert rather than relabel
+        return to_utc(value)
 
 
-class CalendarEvent(Base):
-    __tablename__ = 'calendar_events'
-    
+# Monthly event partitions are created on demand (see create_partition), not by create_all
+PartitionBase = declarative_base()
+
+class CalendarEvent(PartitionBase):
+    """Columns of an event; each month of start times is stored in its own table, see partition_model"""
+    __abstract__ = True
+
+    # Feeds can be shared by several agents, so a UID is only unique per agent
+    client_id = Column(String, primary_key=True, index=True)
+    agent_id = Column(String, primary_key=True, index=True)
     calendar_id = Column(String, primary_key=True)
-    client_id = Column(String, index=True)
-    agent_id = Column(String, index=True)
     summary = Column(String)
     description = Column(String)
     start_time = Column(UTCDateTime, index=True)
     end_time = Column(UTCDateTime)
 
-    # Create combined index
-    __table_args__ = (
-        Index('idx_client_agent_start', 'client_id', 'agent_id', 'start_time'),
-    )
+    # Create combined indexes
+    @declared_attr
+    def __table_args__(cls):
+        return (
+            Index(f'idx_{cls.__tablename__}_client_agent_start', 'client_id', 'agent_id', 'start_time'),
+            Index(f'idx_{cls.__tablename__}_client_agent_start_end', 'client_id', 'agent_id', 'end_time'),
+        )
+
+class EventPartition(Base):
+    """Catalog of monthly event partitions, used to route range queries"""
+    __tablename__ = 'event_partitions'
+
+    table_name = Column(String, primary_key=True)
+    # Events starting in [month_start, month_end) are stored in this partition
+    month_start = Column(UTCDateTime, index=True)
+    month_end = Column(UTCDateTime)
+    # Latest end time of any event written, so queries can skip partitions ending before them
+    max_end_time = Column(UTCDateTime)
+    # Compressed NDJSON file once the partition has been archived and its table dropped
+    archive_path = Column(String)
+    archived_at = Column(UTCDateTime)
+
+class AgentFreeWindow(Base):
+    """Precomputed free windows from now, per agent and standard slot duration"""
+    __tablename__ = 'agent_free_windows'
+
+    client_id = Column(String, primary_key=True)
+    agent_id = Column(String, primary_key=True)
+    duration_minutes = Column(Integer, primary_key=True)
+    # Position of the window, 0 is the earliest (head)
+    seq = Column(Integer, primary_key=True)
+    start_time = Column(UTCDateTime)
+    end_time = Column(UTCDateTime)
+    computed_at = Column(UTCDateTime)
+
+class CalendarChange(Base):
+    """Append-only log of event changes written by merge_events_to_db"""
+    __tablename__ = 'calendar_changes'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    client_id = Column(String)
+    agent_id = Column(String)
+    calendar_id = Column(String)
+    # inserted, updated or deleted; "seeded" for bulk-loaded test data (no calendar_id)
+    change_type = Column(String)
+    # Time range whose availability changed; for updates, old and new times combined
+    range_start = Column(UTCDateTime)
+    range_end = Column(UTCDateTime)
+    created_at = Column(UTCDateTime)
+
     __table_args__ = (
-        Index('idx_client_agent_start_end', 'client_id', 'agent_id', 'end_time'),
+        Index('idx_changes_client_agent_id', 'client_id', 'agent_id', 'id'),
     )
 
-# Global variables for engine and session
+# Global variables for backend, engines and thread-local session registries
+backend = None
 engine = None
-session = None
+read_engine = None
+Session = None
+ReadSession = None
+_init_lock = threading.Lock()
+
+def init_db(db_url: str = None):
+    global backend, engine, read_engine, Session, ReadSession
+    with _init_lock:
+        if engine is None:
+            # Create database engines and tables
+            db_url = db_url or config.DATABASE_URL
+            backend = get_backend(db_url)
+            engine, read_engine = backend.create_engines(db_url)
+            metrics.instrument_engine(engine)
+            if read_engine.pool is not engine.pool:
+                metrics.instrument_engine(read_engine)
+            Base.metadata.create_all(engine)
+            backend.setup_schema(engine)
+
+            # Writer sessions are for the sync job, reader sessions for API queries
+            writer_sessions = sessionmaker(bind=engine)
+            listen(writer_sessions, "before_flush", _raise_partition_ends)
+            listen(writer_sessions, "after_rollback", _discard_partition_ends)
+            Session = scoped_session(writer_sessions)
+            ReadSession = scoped_session(sessionmaker(bind=read_engine))
+            migrate_legacy_events()
 
-def init_db():
-    # Create database URL using absolute path
-    db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'calendar.db'))
-    db_url = f"sqlite:///{db_path}"
-    
-    global engine, session
-    if engine is None:
-        # Create database engine and tables
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        
-    # Create session factory
-    Session = sessionmaker(bind=engine)
-    
     return engine, Session()
 
 def get_db():
-    global engine, session
-    if session is None:
-        engine, session = init_db()
+    """Session bound to the single writer connection"""
+    if Session is None:
+        init_db()
+    return Session()
 
-    return session
+def get_read_db():
+    """Session bound to the read-only pool; close it after use to release the snapshot"""
+    if ReadSession is None:
+        init_db()
+    return ReadSession()
 
 def close_db():
-    global session
-    if session:
-        session.close()
-        session = None
+    if Session is not None:
+        Session.remove()
+    if ReadSession is not None:
+        ReadSession.remove()
+
+def dispose_db():
+    """Close sessions and connection pools, e.g. in tests or after forking a worker"""
+    global backend, engine, read_engine, Session, ReadSession
+    close_db()
+    with _init_lock:
+        if engine is not None:
+            engine.dispose()
+            read_engine.dispose()
+        backend = engine = read_engine = Session = ReadSession = None
     
+
+def month_of(value: datetime) -> datetime:
+    """First instant (UTC) of the month containing value"""
+    value = to_utc(value)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+def partition_name(month: datetime) -> str:
+    return f"calendar_events_{month:%Y_%m}"
+
+_partition_models = {}
+_partition_models_lock = threading.Lock()
+
+def partition_model(month: datetime):
+    """Mapped event class for the partition of events starting in month"""
+    month = month_of(month)
+    name = partition_name(month)
+    with _partition_models_lock:
+        model = _partition_models.get(name)
+        if model is None:
+            model = type(f"CalendarEvent{month:%Y%m}", (CalendarEvent,), {"__tablename__": name})
+            _partition_models[name] = model
+    return model
+
+def load_partitions(session):
+    """Partition catalog keyed by table name"""
+    return {partition.table_name: partition for partition in session.query(EventPartition)}
+
+def create_partition(session, month: datetime) -> EventPartition:
+    """Create the table for a month of events and register it in the catalog, if another writer hasn't already"""
+    model = partition_model(month)
+    name = model.__tablename__
+    # DDL goes through the session's connection; SQLite has a single writer connection
+    connection = session.connection()
+    backend.lock_partition(connection, name)
+    if not inspect(connection).has_table(name):
+        model.__table__.create(connection)
+        backend.setup_partition(connection, name)
+    connection.execute(
+        backend.insert(EventPartition.__table__).values(
+            table_name=name,
+            month_start=month,
+            month_end=add_months(month, 1),
+            max_end_time=month
+        ).on_conflict_do_nothing(index_elements=["table_name"])
+    )
+    return session.get(EventPartition, name, populate_existing=True)
+
+def partition_for(session, partitions, start_time: datetime, end_time: datetime):
+    """
+    Model of the partition to write an event to, creating the partition if needed
+
+    Returns:
+        The mapped class, or None if the event's month has been archived
+    """
+    month = month_of(start_time)
+    name = partition_name(month)
+    partition = partitions.get(name)
+    if partition is None:
+        partition = partitions[name] = create_partition(session, month)
+    if partition.archive_path is not None:
+        return None
+    # Raised in the catalog on the next flush, not on the loaded row, which may be stale
+    ends = session.info.setdefault("partition_ends", {})
+    end_time = to_utc(end_time)
+    if name not in ends or ends[name] < end_time:
+        ends[name] = end_time
+    return partition_model(month)
+
+def _discard_partition_ends(session):
+    session.info.pop("partition_ends", None)
+
+def _raise_partition_ends(session, flush_context, instances):
+    """Raise each partition's max_end_time atomically so concurrent writers can't lower it"""
+    ends = session.info.pop("partition_ends", None)
+    if not ends:
+        return
+    connection = session.connection()
+    for name, end_time in ends.items():
+        end_time = literal(end_time, UTCDateTime())
+        connection.execute(
+            update(EventPartition.__table__)
+            .where(EventPartition.table_name == name)
+            .values(max_end_time=case(
+                (EventPartition.max_end_time < end_time, end_time),
+                else_=EventPartition.max_end_time
+            ))
+        )
+
+def overlapping_partitions(db, start_time: datetime, end_time: datetime, include_archive: bool = False):
+    """Catalog entries of partitions that can hold events overlapping [start_time, end_time), oldest first"""
+    query = db.query(EventPartition).filter(
+        (EventPartition.month_start < end_time) &
+        (EventPartition.max_end_time > start_time)
+    )
+    if not include_archive:
+        query = query.filter(EventPartition.archive_path.is_(None))
+    return query.order_by(EventPartition.month_start.asc()).all()
+
+LEGACY_EVENTS_TABLE = 'calendar_events'
+
+def migrate_legacy_events() -> int:
+    """
+    Move rows of the single calendar_events table used before events were
+    keyed per agent and partitioned by month into the monthly partitions,
+    then drop it. Runs from init_db; a no-op once the table is gone.
+
+    Returns:
+        Number of events migrated
+    """
+    if not inspect(engine).has_table(LEGACY_EVENTS_TABLE):
+        return 0
+    legacy = Table(LEGACY_EVENTS_TABLE, MetaData(), autoload_with=engine)
+    session = Session()
+    migrated = 0
+    try:
+        partitions = load_partitions(session)
+        rows = session.execute(select(
+            legacy.c.client_id, legacy.c.agent_id, legacy.c.calendar_id,
+            legacy.c.summary, legacy.c.description, legacy.c.start_time, legacy.c.end_time
+        ).execution_options(yield_per=5000))
+        for batch in rows.partitions():
+            for row in batch:
+                start_time, end_time = to_utc(row.start_time), to_utc(row.end_time)
+                model = partition_for(session, partitions, start_time, end_time)
+                if model is None:
+                    continue
+                session.add(model(
+                    client_id=row.client_id,
+                    agent_id=row.agent_id,
+                    calendar_id=row.calendar_id,
+                    summary=row.summary,
+                    description=row.description,
+                    start_time=start_time,
+                    end_time=end_time
+                ))
+                migrated += 1
+            session.flush()
+        legacy.drop(session.connection())
+        session.commit()
+    except Exception:
+        session.rollback()
+        # Another process (an API worker or the sync job) may have migrated it first
+        if inspect(engine).has_table(LEGACY_EVENTS_TABLE):
+            raise
+        return 0
+    finally:
+        Session.remove()
+    print(f"Migrated {migrated} events from {LEGACY_EVENTS_TABLE} into monthly partitions")
+    return migrated
+
 def sync_calendar_to_db(client_id: str, agent_id: str, calendar_path):
     """Sync calendar events to database"""
     
-    cal = None
-    with open(calendar_path, 'rb') as f:
-        cal = Calendar.from_ical(f.read())
+    events = parse_calendar_feed(read_calendar_feed(calendar_path))
 
     session = get_db()
-    # Process each event
-    for component in cal.walk('VEVENT'):
-        existing_event = session.query(CalendarEvent).filter_by(
-            calendar_id=str(component.get('uid'))  # Convert vText to string
-        ).first()
-        if existing_event:
-            continue
+    try:
+        partitions = load_partitions(session)
+        now = datetime.now(timezone.utc)
+        # Process each event
+        for fields in events:
+            model = partition_for(session, partitions, fields["start_time"], fields["end_time"])
+            if model is None or session.get(model, (client_id, agent_id, fields["calendar_id"])):
+                continue
+            session.add(model(client_id=client_id, agent_id=agent_id, **fields))
+            # Logged like merges so snapshot readers and change subscribers see the write
+            session.add(CalendarChange(
+                client_id=client_id,
+                agent_id=agent_id,
+                calendar_id=fields["calendar_id"],
+                change_type="inserted",
+                range_start=fields["start_time"],
+                range_end=fields["end_time"],
+                created_at=now
+            ))
 
-        event = CalendarEvent(
-            calendar_id=component.get('uid'),
-            client_id=client_id,
-            agent_id=agent_id,
-            summary=str(component.get('summary')),
-            description=str(component.get('description', '')),  
-            start_time=component.get('dtstart').dt,
-            end_time=component.get('dtend').dt
-        )
-        
-        session.add(event)
-    
-    # Commit changes
-    session.commit()
-    session.close()
+        # Commit changes
+        session.commit()
+    finally:
+        session.close()
 
     
+def read_calendar_feed(calendar_path) -> bytes:
+    """Raw bytes of a calendar feed"""
+    with open(calendar_path, 'rb') as f:
+        return f.read()
+
+def parse_calendar_feed(data: bytes):
+    """Parse iCalendar bytes into event dicts with UTC start and end times"""
+    with metrics.calendar_sync_parse_seconds.time():
+        cal = Calendar.from_ical(data)
+        return [
+            {
+                "calendar_id": str(component.get('uid')),
+                "summary": str(component.get('summary')),
+                "description": str(component.get('description', '')),
+                "start_time": to_utc(component.get('dtstart').dt),
+                "end_time": to_utc(component.get('dtend').dt),
+            } for component in cal.walk('VEVENT')
+        ]
+
 def merge_calendar_to_db(client_id: str, agent_id: str, calendar_path):
-    """Merge calendar events to database, updating existing events and removing deleted ones"""
+    """
+    Merge calendar events to database, updating existing events and removing deleted ones
+
+    Returns:
+        Number of events inserted, changed or deleted, or None if the merge failed
+    """
 
     print(f"Merging calendar to db for {client_id} {agent_id} {calendar_path}")
     try:
-        cal = None
-        with open(calendar_path, 'rb') as f:
-            cal = Calendar.from_ical(f.read())
-
-        # Collect all event UIDs from the calendar file
-        calendar_uids = {str(component.get('uid')) for component in cal.walk('VEVENT')}
-        
-        session = get_db()
-        # Delete events that are no longer in the calendar
-        session.query(CalendarEvent).filter(
-            (CalendarEvent.client_id == client_id) &
-            (CalendarEvent.agent_id == agent_id) &
-            ~CalendarEvent.calendar_id.in_(calendar_uids)
-        ).delete(synchronize_session='fetch')
-    
-        # Process each event
-        for component in cal.walk('VEVENT'):
-            calendar_id = str(component.get('uid'))
-            existing_event = session.query(CalendarEvent).filter_by(
-                calendar_id=calendar_id
-            ).first()
-
-            if existing_event:
-                # Update existing event
-                existing_event.summary = str(component.get('summary'))
-                existing_event.description = str(component.get('description', ''))
-                existing_event.start_time = component.get('dtstart').dt
-                existing_event.end_time = component.get('dtend').dt
-            else:
-                # Create new event
-                event = CalendarEvent(
-                    calendar_id=calendar_id,
-                    client_id=client_id,
-                    agent_id=agent_id,
-                    summary=str(component.get('summary')),
-                    description=str(component.get('description', '')),
-                    start_time=component.get('dtstart').dt,
-                    end_time=component.get('dtend').dt
-                )
-                session.add(event)
-            
-        # Commit changes
-        session.commit()
+        events = parse_calendar_feed(read_calendar_feed(calendar_path))
     except Exception as e:
+        metrics.calendar_sync_total.inc(result="error")
         print(f"Error merging calendar to db: {str(e)}")
-    finally:
-        session.close()
+        return None
+    return merge_events_to_db(client_id, agent_id, events)
+
+def _merge_agent_events(session, client_id: str, agent_id: str, events):
+    """Stage the merge of an agent's feed events in session; returns (inserted, updated, deleted)"""
+    # Collect all event UIDs from the calendar feed
+    calendar_uids = {event["calendar_id"] for event in events}
+
+    now = datetime.now(timezone.utc)
+
+    def log_change(calendar_id, change_type, range_start, range_end):
+        session.add(CalendarChange(
+            client_id=client_id,
+            agent_id=agent_id,
+            calendar_id=calendar_id,
+            change_type=change_type,
+            range_start=range_start,
+            range_end=range_end,
+            created_at=now
+        ))
+
+    # Load the agent's events with one query per live partition instead of one lookup per event
+    partitions = load_partitions(session)
+    existing_events = {}
+    for partition in partitions.values():
+        if partition.archive_path is not None:
+            continue
+        model = partition_model(partition.month_start)
+        existing_events.update((event.calendar_id, event) for event in session.query(model).filter(
+            (model.client_id == client_id) &
+            (model.agent_id == agent_id)
+        ))
+
+    # Delete events that are no longer in the calendar
+    deleted = 0
+    for calendar_id in list(existing_events):
+        if calendar_id not in calendar_uids:
+            event = existing_events.pop(calendar_id)
+            log_change(calendar_id, "deleted", event.start_time, event.end_time)
+            session.delete(event)
+            deleted += 1
 
-def get_agent_events(client_id: str, agent_id: str, start_time: datetime, end_time: datetime):
+    inserted = updated = 0
+    # Process each event
+    for fields in events:
+        calendar_id = fields["calendar_id"]
+        existing_event = existing_events.get(calendar_id)
+        model = partition_for(session, partitions, fields["start_time"], fields["end_time"])
+        if model is None:
+            # Archived months are read-only history
+            continue
+
+        if existing_event and type(existing_event) is not model:
+            # Moved to another month: replace the row in the new partition
+            session.delete(existing_event)
+            existing_events[calendar_id] = model(client_id=client_id, agent_id=agent_id, **fields)
+            session.add(existing_events[calendar_id])
+            updated += 1
+            log_change(calendar_id, "updated",
+                       min(existing_event.start_time, fields["start_time"]),
+                       max(existing_event.end_time, fields["end_time"]))
+        elif existing_event:
+            # Update existing event, counting only real changes
+            old_start, old_end = existing_event.start_time, existing_event.end_time
+            changed = False
+            for name in ("summary", "description", "start_time", "end_time"):
+                if getattr(existing_event, name) != fields[name]:
+                    setattr(existing_event, name, fields[name])
+                    changed = True
+            if changed:
+                updated += 1
+                log_change(calendar_id, "updated",
+                           min(old_start, fields["start_time"]), max(old_end, fields["end_time"]))
+        else:
+            # Create new event
+            event = model(client_id=client_id, agent_id=agent_id, **fields)
+            session.add(event)
+            existing_events[calendar_id] = event
+            inserted += 1
+            log_change(calendar_id, "inserted", fields["start_time"], fields["end_time"])
+
+    return inserted, updated, deleted
+
+# Attempts at a merge that loses a race with another writer (e.g. creating the same month's partition)
+MERGE_ATTEMPTS = 3
+
+def merge_events_to_db(client_id: str, agent_id: str, events):
+    """
+    Merge parsed feed events (see parse_calendar_feed) into an agent's calendar
+
+    Returns:
+        Number of events inserted, changed or deleted, or None if the merge failed
+    """
+    started = time.perf_counter()
+    with metrics.track_queries() as query_stats:
+        try:
+            for attempt in range(1, MERGE_ATTEMPTS + 1):
+                session = get_db()
+                try:
+                    inserted, updated, deleted = _merge_agent_events(session, client_id, agent_id, events)
+                    session.commit()
+                    break
+                except (IntegrityError, OperationalError) as e:
+                    if attempt == MERGE_ATTEMPTS:
+                        raise
+                    print(f"Retrying merge for {client_id}/{agent_id}: {str(e)}")
+                finally:
+                    session.close()
+            metrics.calendar_sync_rows_written_total.inc(inserted, operation="inserted")
+            metrics.calendar_sync_rows_written_total.inc(updated, operation="updated")
+            metrics.calendar_sync_rows_written_total.inc(deleted, operation="deleted")
+            metrics.calendar_sync_total.inc(result="success")
+            return inserted + updated + deleted
+        except Exception as e:
+            metrics.calendar_sync_total.inc(result="error")
+            print(f"Error merging calendar to db: {str(e)}")
+        finally:
+            metrics.calendar_sync_duration_seconds.observe(time.perf_counter() - started)
+            metrics.calendar_sync_db_queries.observe(query_stats.count)
+
+def query_agent_events(client_id: str, agent_id: str, start_time: datetime, end_time: datetime,
+                       include_archive: bool = False):
+    """
+    Events of an agent overlapping [start_time, end_time), ordered by start_time.
+    Only partitions that can overlap the window are queried; archived months are
+    read from their compressed files when include_archive is set. Raises on errors.
+    """
+    db = get_read_db()
     try:
-        db = get_db()
-        query = db.query(CalendarEvent).filter(
-            (CalendarEvent.client_id == client_id) &
-            (CalendarEvent.agent_id == agent_id) &
-            (
-                ( #event starts after start_time and ends after end_time
-                    (CalendarEvent.start_time >= start_time) &
-                    (CalendarEvent.end_time <= end_time)
-                ) |
-                ( #event starts before start_time and ends after start_time
-                    (CalendarEvent.start_time < start_time) &
-                    (CalendarEvent.end_time >= start_time)
-                )
+        events = []
+        for partition in overlapping_partitions(db, start_time, end_time, include_archive):
+            if partition.archive_path is not None:
+                events.extend(read_archived_events(partition, client_id, [agent_id], start_time, end_time))
+                continue
+            model = partition_model(partition.month_start)
+            query = db.query(model).filter(
+                (model.client_id == client_id) &
+                (model.agent_id == agent_id) &
+                backend.overlap_clause(model, start_time, end_time)
             )
-        )
-        
-        events = query.order_by(CalendarEvent.start_time.asc()).all()
+            events.extend(query.order_by(model.start_time.asc()).all())
         return events
+    finally:
+        # End the read transaction so the next query sees the latest sync
+        db.close()
+
+def get_agent_events(client_id: str, agent_id: str, start_time: datetime, end_time: datetime,
+                     include_archive: bool = False):
+    """Like query_agent_events, but logs errors and returns no events"""
+    try:
+        return query_agent_events(client_id, agent_id, start_time, end_time, include_archive)
     except Exception as e:
         print(f"Error in get_events: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+
+def publish_schedule_snapshot(path: str = None, horizon_days: int = None) -> int:
+    """Write busy intervals of all agents to the shared snapshot file read by API workers"""
+    path = path or config.SNAPSHOT_PATH
+    horizon_days = horizon_days if horizon_days is not None else config.SNAPSHOT_HORIZON_DAYS
+    horizon_start = datetime.now(timezone.utc) - timedelta(days=1)
+    horizon_end = horizon_start + timedelta(days=horizon_days + 1)
+
+    db = get_read_db()
+    try:
+        # Read before the events, so changes made while publishing mark the snapshot stale
+        latest = db.query(CalendarChange.id).order_by(CalendarChange.id.desc()).first()
+        change_id = latest[0] if latest else 0
+        intervals = {}
+        for partition in overlapping_partitions(db, horizon_start, horizon_end):
+            model = partition_model(partition.month_start)
+            rows = db.query(
+                model.client_id, model.agent_id, model.start_time, model.end_time
+            ).filter(
+                backend.overlap_clause(model, horizon_start, horizon_end)
+            ).yield_per(5000)
+            for client_id, agent_id, start_time, end_time in rows:
+                intervals.setdefault((client_id, agent_id), []).append((start_time, end_time))
+    finally:
+        db.close()
+
+    count = write_snapshot(path, intervals, horizon_start, horizon_end, change_id)
+    print(f"Published schedule snapshot with {count} busy intervals for {len(intervals)} agents")
+    return count
+
+
+def refresh_next_slots(client_id: str, agent_id: str, now: datetime = None) -> None:
+    """Recompute an agent's free windows for each standard duration, starting from now"""
+    now = now or datetime.now(timezone.utc)
+    horizon_end = now + timedelta(days=config.NEXT_SLOTS_HORIZON_DAYS)
+    # Let read errors propagate: an empty result would be stored as one long free window
+    events = query_agent_events(client_id, agent_id, now, horizon_end)
+    gaps = free_gaps([(event.start_time, event.end_time) for event in events], now, horizon_end)
+
+    session = get_db()
+    try:
+        session.query(AgentFreeWindow).filter(
+            (AgentFreeWindow.client_id == client_id) &
+            (AgentFreeWindow.agent_id == agent_id)
+        ).delete(synchronize_session=False)
+
+        for duration_minutes in config.NEXT_SLOTS_DURATIONS:
+            duration = timedelta(minutes=duration_minutes)
+            seq = slot_count = 0
+            for gap_start, gap_end in gaps:
+                if slot_count >= config.NEXT_SLOTS_COUNT:
+                    break
+                fits = (gap_end - gap_start) // duration
+                if fits == 0:
+                    continue
+                session.add(AgentFreeWindow(
+                    client_id=client_id,
+                    agent_id=agent_id,
+                    duration_minutes=duration_minutes,
+                    seq=seq,
+                    start_time=gap_start,
+                    end_time=gap_end,
+                    computed_at=now
+                ))
+                seq += 1
+                slot_count += fits
+        session.commit()
+    finally:
+        session.close()
+
+def refresh_expired_next_slots(now: datetime = None) -> int:
+    """Recompute agents whose head window can no longer fit a slot from now"""
+    now = now or datetime.now(timezone.utc)
+    db = get_read_db()
+    try:
+        heads = db.query(AgentFreeWindow).filter(AgentFreeWindow.seq == 0).all()
+    finally:
+        db.close()
+
+    expired = {
+        (head.client_id, head.agent_id) for head in heads
+        if head.end_time - timedelta(minutes=head.duration_minutes) < now
+    }
+    for client_id, agent_id in expired:
+        refresh_next_slots(client_id, agent_id, now)
+    return len(expired)
+
+def get_next_free_windows(client_id: str, agent_id: str, duration_minutes: int):
+    """Precomputed free windows for a standard duration, earliest first; empty if not computed"""
+    db = get_read_db()
+    try:
+        windows = db.query(AgentFreeWindow).filter(
+            (AgentFreeWindow.client_id == client_id) &
+            (AgentFreeWindow.agent_id == agent_id) &
+            (AgentFreeWindow.duration_minutes == duration_minutes)
+        ).order_by(AgentFreeWindow.seq.asc()).all()
+        return [(window.start_time, window.end_time) for window in windows]
+    finally:
+        db.close()
+
+
+def iter_agent_events(client_id: str, agent_ids, start_time: datetime, end_time: datetime, batch_size: int = 1000):
+    """
+    Stream events overlapping [start_time, end_time) for a client, optionally
+    limited to agent_ids, ordered by agent and start time. Archived months are
+    not included.
+
+    Batches are fetched with keyset pagination, each in its own short read, so
+    a slow consumer holds neither a pooled connection nor an open transaction
+    (which would stop SQLite from checkpointing the WAL) between batches.
+    Batches may come from different snapshots of a changing schedule.
+    """
+    if ReadSession is None:
+        init_db()
+    # Dedicated sessions: the caller may resume this generator from different threads
+    db = ReadSession.session_factory()
+    try:
+        partitions = overlapping_partitions(db, start_time, end_time)
+    finally:
+        db.close()
+
+    selects = []
+    for partition in partitions:
+        model = partition_model(partition.month_start)
+        partition_query = select(
+            model.calendar_id, model.client_id, model.agent_id,
+            model.summary, model.description,
+            model.start_time, model.end_time
+        ).where(
+            (model.client_id == client_id) &
+            backend.overlap_clause(model, start_time, end_time)
+        )
+        if agent_ids:
+            partition_query = partition_query.where(model.agent_id.in_(list(agent_ids)))
+        selects.append(partition_query)
+    if not selects:
+        return
+
+    events = union_all(*selects).subquery()
+    order = (events.c.agent_id, events.c.start_time, events.c.calendar_id)
+    query = select(events).order_by(*order).limit(batch_size)
+    last = None
+    while True:
+        batch_query = query if last is None else query.where(
+            tuple_(*order) > tuple_(*(literal(value, column.type) for value, column in zip(last, order))))
+        db = ReadSession.session_factory()
+        try:
+            batch = db.execute(batch_query).all()
+        finally:
+            db.close()
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+        last = (batch[-1].agent_id, batch[-1].start_time, batch[-1].calendar_id)
+
+def event_to_dict(event) -> dict:
+    return {
+        "calendar_id": event.calendar_id,
+        "client_id": event.client_id,
+        "agent_id": event.agent_id,
+        "summary": event.summary,
+        "description": event.description,
+        "start_time": event.start_time.isoformat(),
+        "end_time": event.end_time.isoformat(),
+    }
+
+def read_archived_events(partition: EventPartition, client_id: str, agent_ids,
+                         start_time: datetime, end_time: datetime):
+    """Events of an archived partition overlapping [start_time, end_time), in agent and start order"""
+    model = partition_model(partition.month_start)
+    agent_ids = set(agent_ids or ())
+    events = []
+    with gzip.open(partition.archive_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            fields = json.loads(line)
+            if fields["client_id"] != client_id or (agent_ids and fields["agent_id"] not in agent_ids):
+                continue
+            fields["start_time"] = datetime.fromisoformat(fields["start_time"])
+            fields["end_time"] = datetime.fromisoformat(fields["end_time"])
+            if fields["start_time"] < end_time and fields["end_time"] > start_time:
+                events.append(model(**fields))
+    return events
+
+def archive_partitions(now: datetime = None, retention_months: int = None, archive_dir: str = None) -> int:
+    """
+    Move partitions of months that ended more than retention_months ago to
+    gzipped NDJSON files and drop their tables. Archived events stay readable
+    through get_agent_events(include_archive=True).
+
+    Returns:
+        Number of partitions archived
+    """
+    now = now or datetime.now(timezone.utc)
+    retention_months = retention_months if retention_months is not None else config.EVENT_RETENTION_MONTHS
+    archive_dir = archive_dir or config.EVENT_ARCHIVE_DIR
+    cutoff = add_months(month_of(now), -retention_months)
+
+    session = get_db()
+    try:
+        partitions = session.query(EventPartition).filter(
+            EventPartition.archive_path.is_(None) &
+            (EventPartition.month_end <= cutoff)
+        ).order_by(EventPartition.month_start.asc()).all()
+
+        os.makedirs(archive_dir, exist_ok=True)
+        for partition in partitions:
+            model = partition_model(partition.month_start)
+            path = os.path.join(archive_dir, f"{partition.table_name}.ndjson.gz")
+            tmp_path = f"{path}.tmp"
+            rows = session.query(model).order_by(
+                model.client_id.asc(), model.agent_id.asc(), model.start_time.asc()
+            ).yield_per(5000)
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                for event in rows:
+                    f.write(json.dumps(event_to_dict(event)) + "\n")
+            os.replace(tmp_path, path)
+
+            partition.archive_path = path
+            partition.archived_at = now
+            model.__table__.drop(session.connection())
+            session.commit()
+            print(f"Archived event partition {partition.table_name} to {path}")
+        return len(partitions)
+    finally:
+        session.close()
+
+def get_latest_change_id(settled_seconds: float = 0) -> int:
+    """
+    Id of the newest change log record, 0 if the log is empty. With
+    settled_seconds, only records created at least that long ago count, so
+    lower ids still being committed by running merges are not skipped.
+    """
+    db = get_read_db()
+    try:
+        query = db.query(CalendarChange.id)
+        if settled_seconds:
+            query = query.filter(
+                CalendarChange.created_at < datetime.now(timezone.utc) - timedelta(seconds=settled_seconds))
+        latest = query.order_by(CalendarChange.id.desc()).first()
+        return latest[0] if latest else 0
+    finally:
+        db.close()
+
+def get_changes_since(since_id: int, client_id: str = None, agent_ids=None, limit: int = 1000):
+    """Change log records after since_id, oldest first, optionally for a client's agents"""
+    db = get_read_db()
+    try:
+        query = db.query(CalendarChange).filter(CalendarChange.id > since_id)
+        if client_id is not None:
+            query = query.filter(CalendarChange.client_id == client_id)
+        if agent_ids:
+            query = query.filter(CalendarChange.agent_id.in_(list(agent_ids)))
+        return query.order_by(CalendarChange.id.asc()).limit(limit).all()
+    finally:
+        db.close()
@@ -0,0 +1,95 @@
+"""
+Engine factories for the calendar database.
+
+For SQLite, writes go through a pool holding a single connection so the sync
+job never competes with itself for the write lock. API reads use a separate
+pool of query_only connections; in WAL mode they read a consistent snapshot
+without blocking on, or being blocked by, the writer. Postgres handles
+concurrent readers itself, so both roles share one pool and reads are marked
+read-only.
+"""
+from typing import Tuple
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from App import config
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def sqlite_pragmas(read_only: bool = False) -> list:
+    """PRAGMA statements applied to each new connection, from config"""
+    journal_mode = config.SQLITE_JOURNAL_MODE.upper()
+    synchronous = config.SQLITE_SYNCHRONOUS.upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"Invalid SQLITE_JOURNAL_MODE: {config.SQLITE_JOURNAL_MODE}")
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {config.SQLITE_SYNCHRONOUS}")
+
+    pragmas = [
+        f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA cache_size={int(config.SQLITE_CACHE_SIZE)}",
+        f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # journal_mode is persistent in the database file, so the writer sets it for everyone
+        pragmas.append(f"PRAGMA journal_mode={journal_mode}")
+        pragmas.append(f"PRAGMA synchronous={synchronous}")
+    return pragmas
+
+
+def _apply_pragmas(engine: Engine, pragmas: list) -> None:
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def create_sqlite_engines(db_path: str) -> Tuple[Engine, Engine]:
+    """Create (writer, reader) engines for the SQLite database at db_path"""
+    db_url = f"sqlite:///{db_path}"
+    connect_args = {
+        # Pooled connections are handed between threads
+        "check_same_thread": False,
+        "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+    }
+
+    writer = create_engine(
+        db_url,
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=config.SQLITE_POOL_TIMEOUT,
+        connect_args=connect_args,
+    )
+    _apply_pragmas(writer, sqlite_pragmas(read_only=False))
+
+    reader = create_engine(
+        db_url,
+        poolclass=QueuePool,
+        pool_size=config.SQLITE_READER_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=config.SQLITE_POOL_TIMEOUT,
+        connect_args=connect_args,
+    )
+    _apply_pragmas(reader, sqlite_pragmas(read_only=True))
+    return writer, reader
+
+
+def create_postgres_engines(db_url: str) -> Tuple[Engine, Engine]:
+    """Create (writer, reader) engines for a Postgres database URL"""
+    writer = create_engine(
+        db_url,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+    )
+    # Shares the writer's pool and event listeners
+    reader = writer.execution_options(postgresql_readonly=True)
+    return writer, reader
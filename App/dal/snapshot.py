@@ -0,0 +1,212 @@
+"""
+Memory-mapped snapshot of busy intervals shared by all API worker processes.
+
+The sync job writes a compact binary file after each sync and atomically
+renames it into place. Every worker maps it read-only, so availability
+lookups are zero-copy reads against the OS page cache and memory does not
+grow with the number of workers.
+
+File layout (native byte order, the file is only shared on one host):
+    header    magic, generated_at, horizon_start, horizon_end, change_id, num_keys, keys_len
+    keys      JSON list of [client_id, agent_id], sorted, padded to 8 bytes
+    offsets   int64[num_keys + 1], index of each key's first interval
+    spans     int64[num_keys], longest interval of each key
+    starts    int64[num_intervals], microseconds since the epoch (UTC)
+    ends      int64[num_intervals]
+
+Each event is stored as its own interval, sorted by start per key, so
+lookups return the same conflicts as the database. A window lookup is a
+binary search on starts from window start minus the key's longest span,
+filtered on ends. change_id is the newest change log
+record when the snapshot was read from the database; readers stop trusting
+the snapshot once the log has moved past it.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from App import config
+
+MAGIC = b"HWSNAP03"
+HEADER = struct.Struct("=8s6q")
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+Key = Tuple[str, str]
+
+
+def to_micros(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // ONE_MICROSECOND
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def write_snapshot(path: str, intervals: Dict[Key, Iterable[Tuple[datetime, datetime]]],
+                   horizon_start: datetime, horizon_end: datetime, change_id: int = 0) -> int:
+    """Write busy intervals per (client_id, agent_id) and atomically replace path"""
+    keys = sorted(intervals)
+    offsets = array("q", [0])
+    spans = array("q")
+    starts = array("q")
+    ends = array("q")
+    for key in keys:
+        span = 0
+        for start, end in sorted((to_micros(s), to_micros(e)) for s, e in intervals[key]):
+            starts.append(start)
+            ends.append(end)
+            span = max(span, end - start)
+        offsets.append(len(starts))
+        spans.append(span)
+
+    keys_blob = json.dumps([list(key) for key in keys]).encode()
+    keys_blob += b" " * (-len(keys_blob) % 8)
+    header = HEADER.pack(MAGIC, to_micros(datetime.now(timezone.utc)),
+                         to_micros(horizon_start), to_micros(horizon_end), change_id, len(keys), len(keys_blob))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(keys_blob)
+        for values in (offsets, spans, starts, ends):
+            f.write(values.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    # Readers holding the old mapping keep using it until they notice the swap
+    os.replace(tmp_path, path)
+    return len(starts)
+
+
+class Snapshot:
+    """A mapped snapshot file"""
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, generated_at, horizon_start, horizon_end, change_id, num_keys, keys_len = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a schedule snapshot: {path}")
+        self.generated_at = generated_at
+        self.horizon_start = horizon_start
+        self.horizon_end = horizon_end
+        self.change_id = change_id
+
+        position = HEADER.size
+        keys = json.loads(bytes(self._mmap[position:position + keys_len]))
+        self._index = {(client_id, agent_id): i for i, (client_id, agent_id) in enumerate(keys)}
+        position += keys_len
+
+        view = memoryview(self._mmap)
+        self._offsets = view[position:position + (num_keys + 1) * 8].cast("q")
+        position += (num_keys + 1) * 8
+        self._spans = view[position:position + num_keys * 8].cast("q")
+        position += num_keys * 8
+        num_intervals = self._offsets[num_keys]
+        self._starts = view[position:position + num_intervals * 8].cast("q")
+        position += num_intervals * 8
+        self._ends = view[position:position + num_intervals * 8].cast("q")
+
+    def covers(self, start: int, end: int) -> bool:
+        return self.horizon_start <= start and end <= self.horizon_end
+
+    def busy(self, key: Key, start: int, end: int) -> List[Tuple[int, int]]:
+        """Busy intervals of key overlapping [start, end), as microseconds"""
+        i = self._index.get(key)
+        if i is None:
+            return []
+        lo, hi = self._offsets[i], self._offsets[i + 1]
+        # No interval starting before start - span can reach the window
+        first = bisect_right(self._starts, start - self._spans[i], lo, hi)
+        last = bisect_left(self._starts, end, first, hi)
+        return [(self._starts[j], self._ends[j]) for j in range(first, last) if self._ends[j] > start]
+
+
+class SnapshotReader:
+    """
+    Per-process handle on the snapshot file. Re-maps when the file is swapped,
+    checking at most once per check_interval seconds. With latest_change_id,
+    the same check drops a snapshot once the database has changes newer than
+    it, e.g. writes made outside the sync loop, until it is republished.
+    """
+    def __init__(self, path: str, max_age_seconds: int = 0, check_interval: float = 1.0,
+                 latest_change_id: Optional[Callable[[], int]] = None):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.check_interval = check_interval
+        self.latest_change_id = latest_change_id
+        self._snapshot: Optional[Snapshot] = None
+        self._stale = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[Snapshot]:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._snapshot = None
+                return None
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if self._snapshot is None or self._snapshot.identity != identity:
+                try:
+                    self._snapshot = Snapshot(self.path)
+                except (OSError, ValueError) as e:
+                    print(f"Error loading schedule snapshot: {str(e)}")
+                    self._snapshot = None
+            self._stale = self._snapshot is not None and self._is_stale(self._snapshot)
+            return self._snapshot
+
+    def _is_stale(self, snapshot: Snapshot) -> bool:
+        if self.latest_change_id is None:
+            return False
+        try:
+            return self.latest_change_id() > snapshot.change_id
+        except Exception as e:
+            print(f"Error checking schedule snapshot version: {str(e)}")
+            return True
+
+    def busy_intervals(self, client_id: str, agent_id: str,
+                       start_time: datetime, end_time: datetime) -> Optional[List[Tuple[datetime, datetime]]]:
+        """
+        Busy intervals overlapping the window, or None when there is no usable
+        snapshot covering it and the caller should query the database.
+        """
+        snapshot = self.current()
+        if snapshot is None or self._stale:
+            return None
+        if self.max_age_seconds and to_micros(datetime.now(timezone.utc)) - snapshot.generated_at > self.max_age_seconds * 1_000_000:
+            return None
+        start, end = to_micros(start_time), to_micros(end_time)
+        if not snapshot.covers(start, end):
+            return None
+        return [(from_micros(s), from_micros(e)) for s, e in snapshot.busy((client_id, agent_id), start, end)]
+
+
+_reader = None
+
+def get_snapshot_reader() -> Optional[SnapshotReader]:
+    """The process-wide snapshot reader, or None when snapshots are disabled"""
+    global _reader
+    if not config.SNAPSHOT_ENABLED:
+        return None
+    if _reader is None:
+        # Imported here: the DAL imports this module to write snapshots
+        from App.dal.calendar import get_latest_change_id
+        _reader = SnapshotReader(config.SNAPSHOT_PATH, config.SNAPSHOT_MAX_AGE_SECONDS,
+                                 latest_change_id=get_latest_change_id)
+    return _reader
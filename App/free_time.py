@@ -0,0 +1,68 @@
+"""
+Free-time arithmetic shared by the DAL (precomputed next slots) and the API.
+"""
+from datetime import datetime, timedelta
+
+
+def free_gaps(busy, start_time: datetime, end_time: datetime):
+    """
+    Find free intervals within [start_time, end_time) not covered by busy intervals
+    Args:
+        busy: Iterable of (start, end) tuples, in any order, may overlap
+        start_time: Start of the search range
+        end_time: End of the search range
+    Returns:
+        List of (start, end) tuples sorted by start
+    """
+    gaps = []
+    cursor = start_time
+    for busy_start, busy_end in sorted(busy):
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end_time:
+            break
+        if busy_start > cursor:
+            gaps.append((cursor, busy_start))
+        cursor = busy_end
+    if cursor < end_time:
+        gaps.append((cursor, end_time))
+    return gaps
+
+def slots_from_gaps(gaps, duration_minutes: int, limit: int = 3, start_time: datetime = None):
+    """
+    Pack back-to-back slots of duration_minutes into free gaps, earliest first
+    Args:
+        gaps: List of (start, end) free intervals sorted by start
+        duration_minutes: Required duration in minutes
+        limit: Maximum number of slots to return
+        start_time: Ignore free time before this, e.g. now
+    Returns:
+        List of slot dicts with start, end and duration_minutes
+    """
+    available_slots = []
+    duration_delta = timedelta(minutes=duration_minutes)
+    for gap_start, gap_end in gaps:
+        slot_start = gap_start if start_time is None else max(gap_start, start_time)
+        while slot_start + duration_delta <= gap_end:
+            available_slots.append({
+                "start": slot_start,
+                "end": slot_start + duration_delta,
+                "duration_minutes": duration_minutes
+            })
+            if len(available_slots) >= limit:
+                return available_slots
+            slot_start += duration_delta
+    return available_slots
+
+def clip_gaps(gaps, start_time: datetime, end_time: datetime):
+    """
+    Restrict free gaps, sorted by start, to [start_time, end_time)
+    """
+    clipped = []
+    for gap_start, gap_end in gaps:
+        if gap_end <= start_time:
+            continue
+        if gap_start >= end_time:
+            break
+        clipped.append((max(gap_start, start_time), min(gap_end, end_time)))
+    return clipped
@@ -1,14 +1,27 @@
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add project root to Python path so App.* imports resolve when run as a script
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
 
 import time
+import hashlib
 from datetime import datetime, timedelta
 import schedule
 from typing import List, Dict
 from queue import Queue, Empty
 import threading
-from dal.calendar import merge_calendar_to_db
+from App.dal.calendar import (
+    read_calendar_feed,
+    parse_calendar_feed,
+    merge_events_to_db,
+    publish_schedule_snapshot,
+    refresh_next_slots,
+    refresh_expired_next_slots,
+    archive_partitions
+)
+from App import config, metrics
 
 class CalendarSyncQueue:
     def __init__(self, num_consumers: int = 2):
@@ -16,19 +29,26 @@ class CalendarSyncQueue:
         self.num_consumers = num_consumers
         self.consumers = []
         self.should_stop = threading.Event()
+        metrics.calendar_sync_queue_depth.set_function(self.task_queue.qsize)
         
     def consumer(self) -> None:
         while not self.should_stop.is_set():
             try:
-                agent = self.task_queue.get(timeout=5)
+                feed = self.task_queue.get(timeout=5)
                 try:
-                    merge_calendar_to_db(
-                        agent["client_id"],
-                        agent["agent_id"],
-                        agent["calendar_url"]
-                    )
+                    # Parse each distinct feed once and fan the events out to every agent using it
+                    try:
+                        events = parse_calendar_feed(feed["data"])
+                    except Exception:
+                        # None of the feed's agents can be merged; count them like failed merges
+                        metrics.calendar_sync_total.inc(len(feed["agents"]), result="error")
+                        raise
+                    metrics.calendar_sync_feeds_total.inc(outcome="parsed")
+                    metrics.calendar_sync_feeds_total.inc(len(feed["agents"]) - 1, outcome="shared")
+                    for agent in feed["agents"]:
+                        self.sync_agent(agent, feed["digest"], events)
                 except Exception as e:
-                    print(f"Error syncing calendar for agent {agent['agent_id']}: {str(e)}")
+                    print(f"Error syncing calendar feed {feed['digest'][:12]}: {str(e)}")
                 finally:
                     self.task_queue.task_done()
             except Empty:
@@ -37,6 +57,17 @@ class CalendarSyncQueue:
                 print(f"Consumer error: {str(e)}")
                 time.sleep(5)
 
+    def sync_agent(self, agent: Dict[str, str], digest: str, events) -> None:
+        print(f"Merging calendar to db for {agent['client_id']} {agent['agent_id']} {agent['calendar_url']}")
+        changes = merge_events_to_db(agent["client_id"], agent["agent_id"], events)
+        if changes is None:
+            return
+        agent["feed_digest"] = digest
+        # Recompute next free slots only when the agent's events changed
+        if config.NEXT_SLOTS_ENABLED and (changes or agent.get("next_slots_at") is None):
+            refresh_next_slots(agent["client_id"], agent["agent_id"])
+            agent["next_slots_at"] = datetime.now()
+
     def start_consumers(self) -> None:
         self.should_stop.clear()
         for _ in range(self.num_consumers):
@@ -50,17 +81,80 @@ class CalendarSyncQueue:
             consumer.join()
         self.consumers.clear()
 
+def group_feeds(agents: List[Dict[str, str]]) -> List[Dict]:
+    """
+    Read each distinct feed once and group agents by the SHA-256 of its content.
+    Agents whose feed content is unchanged since their last successful merge are skipped.
+    """
+    data_by_url = {}
+    feeds = {}
+    for agent in agents:
+        url = agent["calendar_url"]
+        if url not in data_by_url:
+            try:
+                data_by_url[url] = read_calendar_feed(url)
+            except Exception as e:
+                print(f"Error reading calendar feed {url}: {str(e)}")
+                data_by_url[url] = None
+        data = data_by_url[url]
+        if data is None:
+            continue
+
+        digest = hashlib.sha256(data).hexdigest()
+        if agent.get("feed_digest") == digest:
+            metrics.calendar_sync_feeds_total.inc(outcome="unchanged")
+            continue
+        feed = feeds.setdefault(digest, {"digest": digest, "data": data, "agents": []})
+        feed["agents"].append(agent)
+    return list(feeds.values())
+
 def schedule_sync(agent_list: List[Dict[str, str]], interval_mins: int) -> None:
     sync_queue = CalendarSyncQueue()
     sync_queue.start_consumers()
 
+    last_published = None
+    last_archived = None
+
     try:
         while True:
             print("Syncing calendars...")
+            due_agents = []
             for agent in agent_list:
                 if agent.get("last_sync") is None or agent.get("last_sync") < datetime.now() - timedelta(minutes=interval_mins):
                     agent["last_sync"] = datetime.now()
-                    sync_queue.task_queue.put(agent)
+                    due_agents.append(agent)
+
+            feeds = group_feeds(due_agents)
+            for feed in feeds:
+                sync_queue.task_queue.put(feed)
+            enqueued = len(feeds)
+
+            if config.NEXT_SLOTS_ENABLED:
+                try:
+                    refresh_expired_next_slots()
+                except Exception as e:
+                    print(f"Error refreshing next free slots: {str(e)}")
+
+            if config.SNAPSHOT_ENABLED:
+                snapshot_due = last_published is None or last_published < datetime.now() - timedelta(minutes=config.SNAPSHOT_REFRESH_MINUTES)
+                if enqueued or snapshot_due:
+                    # Publish once this cycle's merges have landed
+                    sync_queue.task_queue.join()
+                    try:
+                        publish_schedule_snapshot()
+                        last_published = datetime.now()
+                    except Exception as e:
+                        print(f"Error publishing schedule snapshot: {str(e)}")
+
+            if config.EVENT_RETENTION_MONTHS > 0:
+                if last_archived is None or last_archived < datetime.now() - timedelta(hours=config.EVENT_ARCHIVE_INTERVAL_HOURS):
+                    # Don't drop a partition under a running merge
+                    sync_queue.task_queue.join()
+                    try:
+                        archive_partitions()
+                        last_archived = datetime.now()
+                    except Exception as e:
+                        print(f"Error archiving event partitions: {str(e)}")
             time.sleep(60)
     except KeyboardInterrupt:
         print("Shutting down calendar sync...")
@@ -75,5 +169,9 @@ if __name__ == "__main__":
             "last_sync": None
         }
     ]
+    metrics_port = os.environ.get("SYNC_METRICS_PORT")
+    if metrics_port:
+        metrics.start_metrics_server(int(metrics_port))
+        print(f"Serving sync metrics on :{metrics_port}/metrics")
     # sync every 2 hours
     schedule_sync(agent_list, 2*60*60)
\ No newline at end of file
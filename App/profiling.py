@@ -0,0 +1,125 @@
+"""
+Low-overhead sampling profiler for API requests.
+
+A background thread periodically captures the stack of the thread serving a
+request and counts identical stacks. Output uses the folded-stack format
+("frame;frame;frame count" per line) understood by flamegraph.pl, speedscope
+and inferno.
+
+Handlers run on the event loop thread, so concurrent requests on the same
+worker show up in each other's profiles; profile under low concurrency when
+isolating a single slow request.
+"""
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+def profile_mode(value: Optional[str]) -> Optional[str]:
+    """
+    Parse an X-Profile header or ?profile= flag: "return" sends the profile back
+    instead of the body, other true values ("1", "true", "yes", "on") save it to
+    PROFILE_DIR, anything else leaves profiling off
+    """
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value == "return":
+        return "return"
+    return "save" if value in ("1", "true", "yes", "on") else None
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Sample the stack of one thread at a fixed interval until stopped"""
+    def __init__(self, thread_id: Optional[int] = None, interval_ms: float = 1.0):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, daemon=True, name="stack-sampler")
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+
+def render_folded(stacks: Counter, root: Optional[str] = None) -> str:
+    """Render stack counts as folded lines, optionally under a common root frame"""
+    prefix = f"{root.replace(';', ':')};" if root else ""
+    return "".join(f"{prefix}{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class ProfileStore:
+    """Aggregated folded stacks per route from continuous 1-in-N sampling"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks: Dict[str, Counter] = {}
+        self._seen = 0
+
+    def should_sample(self, every: int) -> bool:
+        if every <= 0:
+            return False
+        with self._lock:
+            self._seen += 1
+            return self._seen % every == 0
+
+    def add(self, route: str, stacks: Counter) -> None:
+        with self._lock:
+            self._stacks.setdefault(route, Counter()).update(stacks)
+
+    def render(self, route: Optional[str] = None) -> str:
+        with self._lock:
+            items = [(name, Counter(stacks)) for name, stacks in self._stacks.items()
+                     if route is None or name == route]
+        return "".join(render_folded(stacks, root=name) for name, stacks in items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+
+
+profile_store = ProfileStore()
+
+
+def save_profile(stacks: Counter, directory: str, route: str) -> str:
+    """Write a folded profile to directory and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    path = os.path.join(directory, f"{timestamp}-{name}.folded")
+    with open(path, "w") as f:
+        f.write(render_folded(stacks))
+    return path
@@ -1,13 +1,84 @@
-from fastapi import FastAPI, APIRouter
+import time
+from typing import Optional
+from fastapi import FastAPI, APIRouter, Request, Response
+from fastapi.responses import PlainTextResponse
 from App.api.agent_schedule import agent_schedule_router
+from App import config, metrics
+from App.profiling import StackSampler, profile_mode, profile_store, render_folded, save_profile
 
 app = FastAPI()
 
 api_router = APIRouter(prefix="/api/v1")
-@app.get("/")   
+@app.get("/")
 async def root():
     return {"message": "Welcome to the API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+if config.PROFILING_ENABLED or config.PROFILE_SAMPLE_EVERY > 0:
+    @app.get("/debug/profile", include_in_schema=False)
+    async def get_profile(route: Optional[str] = None, reset: bool = False):
+        """Folded stacks aggregated from continuous 1-in-N request sampling"""
+        profile = profile_store.render(route)
+        if reset:
+            profile_store.clear()
+        return PlainTextResponse(profile)
+
+def route_path(request: Request) -> str:
+    # Label by route template rather than raw URL to keep cardinality bounded
+    route = request.scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = "500"
+    with metrics.track_queries() as query_stats:
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            path = route_path(request)
+            if path != "/metrics":
+                metrics.http_requests_total.inc(method=request.method, path=path, status=status)
+                metrics.http_request_duration_seconds.observe(elapsed, method=request.method, path=path)
+                metrics.http_request_db_queries.observe(query_stats.count, method=request.method, path=path)
+                metrics.http_request_db_seconds.observe(query_stats.seconds, method=request.method, path=path)
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Explicit opt-in: X-Profile header or ?profile= flag, "return" sends the profile back instead of the body
+    mode = None
+    if config.PROFILING_ENABLED:
+        mode = profile_mode(request.headers.get("x-profile") or request.query_params.get("profile"))
+    continuous = not mode and profile_store.should_sample(config.PROFILE_SAMPLE_EVERY)
+    if not mode and not continuous:
+        return await call_next(request)
+
+    interval_ms = config.PROFILE_INTERVAL_MS if mode else config.PROFILE_CONTINUOUS_INTERVAL_MS
+    sampler = StackSampler(interval_ms=interval_ms).start()
+    try:
+        response = await call_next(request)
+    finally:
+        stacks = sampler.stop()
+
+    route = f"{request.method} {route_path(request)}"
+    if continuous:
+        profile_store.add(route, stacks)
+        return response
+    if mode == "return":
+        return PlainTextResponse(render_folded(stacks), headers={
+            "X-Profile-Status": str(response.status_code),
+            "X-Profile-Samples": str(sampler.samples),
+        })
+    response.headers["X-Profile-File"] = save_profile(stacks, config.PROFILE_DIR, route)
+    response.headers["X-Profile-Samples"] = str(sampler.samples)
+    return response
+
 # Include agent schedule routes
 api_router.include_router(agent_schedule_router)
 app.include_router(api_router)
@@ -0,0 +1,170 @@
+import pytest
+import json
+from datetime import datetime, timedelta, timezone
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("icalendar")
+
+from fastapi.testclient import TestClient
+from App import config, metrics
+from App.dal import calendar as dal
+from App.dal import snapshot as snapshot_module
+from App.dal.snapshot import SnapshotReader
+from App.api import agent_schedule
+from App.router import app
+
+API = "/api/v1/agent-schedule"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SNAPSHOT_ENABLED", False)
+    dal.dispose_db()
+    dal.init_db(f"sqlite:///{tmp_path / 'calendar.db'}")
+    yield TestClient(app)
+    dal.dispose_db()
+
+
+def utc(hour, minute=0, day=17):
+    return datetime(2025, 2, day, hour, minute, tzinfo=timezone.utc)
+
+
+def feed_event(calendar_id, start_time, end_time):
+    return {"calendar_id": calendar_id, "summary": calendar_id, "description": "",
+            "start_time": start_time, "end_time": end_time}
+
+
+class TestCheckAvailability:
+    def test_snapshot_and_db_report_same_conflicts(self, client, tmp_path, monkeypatch):
+        """Test conflicts are the same events whether the snapshot or the DB answers"""
+        dal.merge_events_to_db("123", "456", [
+            feed_event("a", utc(9), utc(10)),
+            feed_event("b", utc(9, 30), utc(11)),
+            feed_event("c", utc(11), utc(12)),
+        ])
+        params = {"client_id": "123", "agent_id": "456", "start_time": utc(9, 45).isoformat(),
+                  "duration_minutes": 30}
+        from_db = client.get(f"{API}/check-availability", params=params).json()
+
+        # A snapshot whose horizon covers the slot and isn't stale
+        path = str(tmp_path / "calendar.snapshot")
+        dal.write_snapshot(path, {("123", "456"): [(e.start_time, e.end_time) for e in
+                                                   dal.get_agent_events("123", "456", utc(0), utc(23))]},
+                           utc(0), utc(23), dal.get_latest_change_id())
+        reader = SnapshotReader(path, latest_change_id=dal.get_latest_change_id)
+        assert reader.busy_intervals("123", "456", utc(9, 45), utc(10, 15)) is not None
+        monkeypatch.setattr(snapshot_module, "_reader", reader)
+        monkeypatch.setattr(config, "SNAPSHOT_ENABLED", True)
+        from_snapshot = client.get(f"{API}/check-availability", params=params).json()
+
+        assert from_db["available"] is False
+        assert [(datetime.fromisoformat(c["start"]), datetime.fromisoformat(c["end"]))
+                for c in from_db["conflicts"]] == [(utc(9), utc(10)), (utc(9, 30), utc(11))]
+        assert from_snapshot == from_db
+
+    def test_db_error_is_not_reported_as_available(self, client, monkeypatch):
+        """Test a failed event lookup returns the error response instead of a free slot"""
+        def locked(*args, **kwargs):
+            raise RuntimeError("database is locked")
+        monkeypatch.setattr(agent_schedule, "query_agent_events", locked)
+
+        body = client.get(f"{API}/check-availability", params={
+            "client_id": "123", "agent_id": "456", "start_time": utc(9).isoformat()}).json()
+
+        assert body["available"] is False
+        assert body["error"] == "database is locked"
+
+
+class TestFindAvailableTimeslots:
+    def test_fast_path_skips_events_query(self, client, monkeypatch):
+        """Test next slots from now come from the precomputed windows alone, in one query"""
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        meeting = (now + timedelta(hours=3), now + timedelta(hours=4))
+        dal.merge_events_to_db("123", "456", [feed_event("meeting", *meeting)])
+        dal.refresh_next_slots("123", "456")
+
+        def not_called(*args, **kwargs):
+            raise AssertionError("slots were computed from events")
+        monkeypatch.setattr(agent_schedule, "find_slots", not_called)
+        monkeypatch.setattr(agent_schedule, "get_agent_events", not_called)
+        before = metrics.db_queries_total._values.get((), 0)
+        body = client.get(f"{API}/find-available-timeslots", params={
+            "client_id": "123", "agent_id": "456", "duration_minutes": 60, "num_slots": 4}).json()
+
+        assert metrics.db_queries_total._values.get((), 0) == before + 1
+        assert set(body) == {"available_slots", "earliest_slot"}
+        slots = [(datetime.fromisoformat(s["start"]), datetime.fromisoformat(s["end"]))
+                 for s in body["available_slots"]]
+        assert len(slots) == 4
+        assert all(end <= meeting[0] or start >= meeting[1] for start, end in slots)
+        assert body["earliest_slot"] == body["available_slots"][0]["start"]
+
+
+class TestFindAvailableTimeslotsBatch:
+    def test_slots_per_window_and_duration(self, client):
+        """Test every window and duration combination gets its own slots from shared free time"""
+        dal.merge_events_to_db("123", "456", [feed_event("a", utc(9, 30), utc(10))])
+
+        body = client.get(f"{API}/find-available-timeslots/batch", params={
+            "client_id": "123", "agent_id": "456", "durations": [30, 60], "num_slots": 2,
+            "windows": [f"{utc(9).isoformat()}/{utc(11).isoformat()}",
+                        f"{utc(13).isoformat()}/{utc(14).isoformat()}"],
+        }).json()
+
+        starts = [(result["duration_minutes"], [datetime.fromisoformat(slot["start"])
+                                                for slot in result["available_slots"]])
+                  for result in body["results"]]
+        assert starts == [
+            (30, [utc(9), utc(10)]),
+            (60, [utc(10)]),
+            (30, [utc(13), utc(13, 30)]),
+            (60, [utc(13)]),
+        ]
+
+    def test_db_error_is_not_reported_as_free(self, client, monkeypatch):
+        """Test a failed event lookup returns the error response instead of free windows"""
+        def locked(*args, **kwargs):
+            raise RuntimeError("database is locked")
+        monkeypatch.setattr(agent_schedule, "query_agent_events", locked)
+
+        body = client.get(f"{API}/find-available-timeslots/batch", params={
+            "client_id": "123", "agent_id": "456",
+            "windows": [f"{utc(9).isoformat()}/{utc(11).isoformat()}"]}).json()
+
+        assert "results" not in body
+        assert body["error"] == "database is locked"
+
+    @pytest.mark.parametrize("params", [
+        {"durations": [0]},
+        {"durations": [30, -15]},
+        {"num_slots": 0},
+        {"num_slots": 1000},
+        {"durations": list(range(1, 30))},
+        {"windows": ["2025-02-17T09:00:00Z/2025-02-17T08:00:00Z"]},
+        {"windows": ["2025-02-17T09:00:00Z/2025-02-17T10:00:00Z", "2027-02-17T09:00:00Z/2027-02-17T10:00:00Z"]},
+        {"windows": ["2025-02-17T09:00:00Z/2025-04-17T09:00:00Z"]},
+    ])
+    def test_rejects_invalid_parameters(self, client, params):
+        """Test non-positive or oversized durations, slot counts, window lists and window spans are rejected"""
+        response = client.get(f"{API}/find-available-timeslots/batch",
+                              params={"client_id": "123", "agent_id": "456", **params})
+        assert response.status_code == 422
+
+
+class TestExport:
+    def test_ndjson_filtered_by_agent(self, client):
+        """Test the export streams one JSON event per line for the requested agents only"""
+        dal.merge_events_to_db("123", "456", [feed_event("a2", utc(11), utc(12)), feed_event("a1", utc(9), utc(10))])
+        dal.merge_events_to_db("123", "789", [feed_event("b1", utc(10), utc(11))])
+        dal.merge_events_to_db("123", "000", [feed_event("c1", utc(10), utc(11))])
+
+        response = client.get(f"{API}/export", params={
+            "client_id": "123", "agent_ids": ["456", "789"],
+            "start_time": utc(0).isoformat(), "end_time": utc(23).isoformat()})
+
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [(row["agent_id"], row["calendar_id"]) for row in rows] == [
+            ("456", "a1"), ("456", "a2"), ("789", "b1")]
+        assert rows[0] == {"calendar_id": "a1", "client_id": "123", "agent_id": "456", "summary": "a1",
+                           "description": "", "start_time": utc(9).isoformat(), "end_time": utc(10).isoformat()}
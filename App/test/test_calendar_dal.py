@@ -0,0 +1,318 @@
+import gzip
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("icalendar")
+
+from sqlalchemy.exc import IntegrityError
+from App import config
+from App.dal import calendar as dal
+
+# Set TEST_DATABASE_URL=postgresql://... to run against a local Postgres instead of SQLite
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def db(tmp_path):
+    dal.dispose_db()
+    dal.init_db(TEST_DATABASE_URL or f"sqlite:///{tmp_path / 'calendar.db'}")
+    session = dal.get_db()
+    for partition in dal.load_partitions(session).values():
+        if partition.archive_path is None:
+            session.query(dal.partition_model(partition.month_start)).delete()
+    session.commit()
+    yield session
+    dal.dispose_db()
+
+
+def add_event(session, calendar_id, start_time, end_time, agent_id="456", partitions=None):
+    if partitions is None:
+        partitions = dal.load_partitions(session)
+    model = dal.partition_for(session, partitions, start_time, end_time)
+    session.add(model(
+        calendar_id=calendar_id,
+        client_id="123",
+        agent_id=agent_id,
+        summary=calendar_id,
+        description="",
+        start_time=start_time,
+        end_time=end_time,
+    ))
+    session.commit()
+
+
+def utc(hour, minute=0):
+    return datetime(2025, 2, 17, hour, minute, tzinfo=timezone.utc)
+
+
+class TestGetAgentEvents:
+    def test_overlapping_events(self, db):
+        """Test events overlapping the window are returned, including ones crossing either edge"""
+        add_event(db, "before", utc(8), utc(9))
+        add_event(db, "crosses-start", utc(9, 30), utc(10, 30))
+        add_event(db, "inside", utc(11), utc(11, 30))
+        add_event(db, "crosses-end", utc(11, 45), utc(12, 30))
+        add_event(db, "after", utc(12), utc(13))
+        add_event(db, "other-agent", utc(11), utc(11, 30), agent_id="789")
+
+        events = dal.get_agent_events("123", "456", utc(10), utc(12))
+        assert [event.calendar_id for event in events] == ["crosses-start", "inside", "crosses-end"]
+
+    def test_adjacent_events_do_not_overlap(self, db):
+        """Test events ending at the window start or starting at its end are excluded"""
+        add_event(db, "ends-at-start", utc(9), utc(10))
+        add_event(db, "starts-at-end", utc(12), utc(13))
+
+        assert dal.get_agent_events("123", "456", utc(10), utc(12)) == []
+
+    def test_times_are_utc(self, db):
+        """Test returned times are timezone-aware UTC"""
+        add_event(db, "inside", utc(11), utc(11, 30))
+
+        event = dal.get_agent_events("123", "456", utc(10), utc(12))[0]
+        assert event.start_time == utc(11)
+        assert event.start_time.tzinfo == timezone.utc
+
+
+class TestIterAgentEvents:
+    def test_batches_filtered_and_ordered(self, db):
+        """Test export batches cover the requested agents in agent/start order"""
+        add_event(db, "a2", utc(11), utc(12), agent_id="a")
+        add_event(db, "a1", utc(9), utc(10), agent_id="a")
+        add_event(db, "b1", utc(10), utc(11), agent_id="b")
+        add_event(db, "c1", utc(10), utc(11), agent_id="c")
+        add_event(db, "late", utc(20), utc(21), agent_id="a")
+
+        batches = list(dal.iter_agent_events("123", ["a", "b"], utc(8), utc(13), batch_size=2))
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert [row.calendar_id for batch in batches for row in batch] == ["a1", "a2", "b1"]
+
+    def test_no_connection_held_between_batches(self, db):
+        """Test a paused export holds no pooled reader connection, and ties on start time page correctly"""
+        add_event(db, "x", utc(9), utc(10))
+        add_event(db, "y", utc(9), utc(10))
+        add_event(db, "z", utc(9), utc(11))
+        db.close()
+
+        batches = dal.iter_agent_events("123", None, utc(8), utc(13), batch_size=1)
+        first = next(batches)
+        assert dal.read_engine.pool.checkedout() == 0
+        assert [row.calendar_id for batch in [first, *batches] for row in batch] == ["x", "y", "z"]
+
+
+class TestMergeEventsToDb:
+    def test_shared_feed_merges_per_agent(self, db):
+        """Test one parsed feed merges into several agents without colliding on calendar_id"""
+        events = [{"calendar_id": "shared", "summary": "Team sync", "description": "",
+                   "start_time": utc(10), "end_time": utc(11)}]
+        assert dal.merge_events_to_db("123", "456", events) == 1
+        assert dal.merge_events_to_db("123", "789", events) == 1
+        assert dal.merge_events_to_db("123", "456", events) == 0
+
+        assert [event.agent_id for event in dal.get_agent_events("123", "456", utc(9), utc(12))] == ["456"]
+        assert [event.agent_id for event in dal.get_agent_events("123", "789", utc(9), utc(12))] == ["789"]
+
+
+
+class TestChangeLog:
+    def test_merge_logs_changes_with_affected_range(self, db):
+        """Test merges log inserts, real updates (old and new times) and deletes, and nothing when unchanged"""
+        dal.merge_events_to_db("123", "456", [
+            {"calendar_id": "a", "summary": "a", "description": "", "start_time": utc(9), "end_time": utc(10)},
+            {"calendar_id": "b", "summary": "b", "description": "", "start_time": utc(11), "end_time": utc(12)},
+        ])
+        dal.merge_events_to_db("123", "456", [
+            {"calendar_id": "a", "summary": "a", "description": "", "start_time": utc(13), "end_time": utc(14)},
+        ])
+        dal.merge_events_to_db("123", "456", [
+            {"calendar_id": "a", "summary": "a", "description": "", "start_time": utc(13), "end_time": utc(14)},
+        ])
+
+        changes = dal.get_changes_since(0)
+        assert [(c.calendar_id, c.change_type, c.range_start, c.range_end) for c in changes] == [
+            ("a", "inserted", utc(9), utc(10)),
+            ("b", "inserted", utc(11), utc(12)),
+            ("b", "deleted", utc(11), utc(12)),
+            ("a", "updated", utc(9), utc(14)),
+        ]
+        assert dal.get_latest_change_id() == changes[-1].id
+        assert dal.get_changes_since(0, client_id="123", agent_ids=["789"]) == []
+
+
+def day(month, day_of_month, hour=9):
+    return datetime(2025, month, day_of_month, hour, tzinfo=timezone.utc)
+
+
+def feed_event(calendar_id, start_time, end_time):
+    return {"calendar_id": calendar_id, "summary": calendar_id, "description": "",
+            "start_time": start_time, "end_time": end_time}
+
+
+class TestUTCDateTime:
+    def test_results_converted_to_utc(self):
+        """Test values read in a non-UTC session timezone keep their instant, and naive ones are taken as UTC"""
+        column_type = dal.UTCDateTime()
+        berlin = timezone(timedelta(hours=1))
+
+        assert column_type.process_result_value(datetime(2025, 2, 17, 10, tzinfo=berlin), None) == \
+            datetime(2025, 2, 17, 9, tzinfo=timezone.utc)
+        assert column_type.process_result_value(datetime(2025, 2, 17, 9), None).tzinfo == timezone.utc
+        assert column_type.process_result_value(None, None) is None
+
+
+class TestEventPartitions:
+    def test_routes_to_overlapping_months(self, db):
+        """Test events are stored per start month and found across months, including ones spilling over"""
+        add_event(db, "jan", day(1, 10), day(1, 10, 10))
+        add_event(db, "jan-overnight", day(1, 31, 22), day(2, 1, 2))
+        add_event(db, "feb", day(2, 1, 9), day(2, 1, 10))
+        add_event(db, "mar", day(3, 3), day(3, 3, 10))
+
+        assert sorted(dal.load_partitions(db)) == [
+            "calendar_events_2025_01", "calendar_events_2025_02", "calendar_events_2025_03"]
+        events = dal.get_agent_events("123", "456", day(2, 1, 0), day(2, 2, 0))
+        assert [event.calendar_id for event in events] == ["jan-overnight", "feb"]
+
+        batches = dal.iter_agent_events("123", ["456"], day(1, 1, 0), day(4, 1, 0))
+        assert [row.calendar_id for batch in batches for row in batch] == ["jan", "jan-overnight", "feb", "mar"]
+
+    def test_merge_moves_event_between_months(self, db):
+        """Test rescheduling an event into another month moves it to that partition"""
+        assert dal.merge_events_to_db("123", "456", [feed_event("moved", day(1, 20), day(1, 20, 10))]) == 1
+        assert dal.merge_events_to_db("123", "456", [feed_event("moved", day(2, 3), day(2, 3, 10))]) == 1
+
+        assert dal.get_agent_events("123", "456", day(1, 1, 0), day(2, 1, 0)) == []
+        assert [event.start_time for event in dal.get_agent_events("123", "456", day(2, 1, 0), day(3, 1, 0))] == [day(2, 3)]
+
+    def test_stale_catalog_cannot_lower_max_end_time(self, db):
+        """Test a writer holding an old catalog row doesn't shrink a month's range under another writer's event"""
+        add_event(db, "short", day(1, 10), day(1, 10, 10))
+        stale = dal.load_partitions(db)
+        db.close()
+
+        assert dal.merge_events_to_db("123", "789", [feed_event("overnight", day(1, 31, 22), day(2, 1, 6))]) == 1
+        # Attach the catalog rows as loaded before the merge, as a concurrent writer would hold them
+        stale = {name: db.merge(partition, load=False) for name, partition in stale.items()}
+        add_event(db, "later", day(1, 12), day(1, 12, 10), partitions=stale)
+
+        events = dal.get_agent_events("123", "789", day(2, 1, 0), day(2, 2, 0))
+        assert [event.calendar_id for event in events] == ["overnight"]
+
+    def test_create_partition_is_idempotent(self, db):
+        """Test creating a month another writer already created reuses its table and catalog row"""
+        add_event(db, "jan", day(1, 10), day(1, 10, 10))
+
+        partition = dal.create_partition(db, day(1, 1, 0))
+        db.commit()
+
+        assert partition.table_name == "calendar_events_2025_01"
+        assert partition.max_end_time == day(1, 10, 10)
+        assert list(dal.load_partitions(db)) == ["calendar_events_2025_01"]
+        assert [event.calendar_id for event in dal.get_agent_events("123", "456", day(1, 1, 0), day(2, 1, 0))] == ["jan"]
+
+    def test_merge_retries_lost_race(self, db, monkeypatch):
+        """Test a merge that collides with another writer is retried from a fresh session"""
+        merge = dal._merge_agent_events
+        calls = []
+
+        def collide_once(session, *args):
+            calls.append(session)
+            if len(calls) == 1:
+                raise IntegrityError("INSERT INTO event_partitions", {}, Exception("duplicate key"))
+            return merge(session, *args)
+
+        monkeypatch.setattr(dal, "_merge_agent_events", collide_once)
+        assert dal.merge_events_to_db("123", "456", [feed_event("jan", day(1, 10), day(1, 10, 10))]) == 1
+        assert len(calls) == 2
+        assert [event.calendar_id for event in dal.get_agent_events("123", "456", day(1, 1, 0), day(2, 1, 0))] == ["jan"]
+
+    def test_archive_stays_queryable(self, db, tmp_path):
+        """Test old months are archived to gzip files, skipped by default and readable on demand"""
+        events = [feed_event("old", day(1, 10), day(1, 10, 10)), feed_event("recent", day(3, 3), day(3, 3, 10))]
+        assert dal.merge_events_to_db("123", "456", events) == 2
+
+        archived = dal.archive_partitions(now=day(3, 15), retention_months=1, archive_dir=str(tmp_path))
+        assert archived == 1
+        partition = dal.load_partitions(dal.get_db())["calendar_events_2025_01"]
+        with gzip.open(partition.archive_path, "rt") as f:
+            assert len(f.readlines()) == 1
+
+        recent = dal.get_agent_events("123", "456", day(1, 1, 0), day(4, 1, 0))
+        assert [event.calendar_id for event in recent] == ["recent"]
+        history = dal.get_agent_events("123", "456", day(1, 1, 0), day(4, 1, 0), include_archive=True)
+        assert [(event.calendar_id, event.start_time) for event in history] == [
+            ("old", day(1, 10)), ("recent", day(3, 3))]
+
+        # Archived months are read-only, so re-merging the same feed changes nothing
+        assert dal.merge_events_to_db("123", "456", events) == 0
+
+
+class TestNextSlots:
+    def test_refresh_stores_windows_per_duration(self, db):
+        """Test free windows from now are stored per duration, skipping gaps too short for it"""
+        dal.merge_events_to_db("123", "456", [
+            feed_event("a", utc(9), utc(10)),
+            feed_event("b", utc(10, 30), utc(11)),
+        ])
+        dal.refresh_next_slots("123", "456", now=utc(8))
+        horizon_end = utc(8) + timedelta(days=config.NEXT_SLOTS_HORIZON_DAYS)
+
+        assert dal.get_next_free_windows("123", "456", 60) == [(utc(8), utc(9)), (utc(11), horizon_end)]
+        assert dal.get_next_free_windows("123", "456", 30) == [
+            (utc(8), utc(9)), (utc(10), utc(10, 30)), (utc(11), horizon_end)]
+        assert dal.get_next_free_windows("123", "456", 45) == []
+
+    def test_refresh_expired_heads(self, db):
+        """Test agents are recomputed once their earliest window can no longer fit a slot"""
+        dal.merge_events_to_db("123", "456", [feed_event("a", utc(9), utc(10))])
+        dal.refresh_next_slots("123", "456", now=utc(8))
+
+        assert dal.refresh_expired_next_slots(now=utc(8)) == 0
+        assert dal.refresh_expired_next_slots(now=utc(8, 30)) == 1
+        assert dal.get_next_free_windows("123", "456", 60)[0][0] == utc(10)
+        assert dal.get_next_free_windows("123", "456", 15)[0] == (utc(8, 30), utc(9))
+
+    def test_refresh_keeps_windows_on_read_error(self, db, monkeypatch):
+        """Test a failed event read raises instead of storing the whole horizon as free"""
+        dal.merge_events_to_db("123", "456", [feed_event("a", utc(9), utc(10))])
+        dal.refresh_next_slots("123", "456", now=utc(8))
+        before = dal.get_next_free_windows("123", "456", 60)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("database is locked")
+        monkeypatch.setattr(dal, "query_agent_events", fail)
+        with pytest.raises(RuntimeError):
+            dal.refresh_next_slots("123", "456", now=utc(8))
+        assert dal.get_next_free_windows("123", "456", 60) == before
+
+
+class TestLegacyMigration:
+    def test_legacy_table_moves_into_partitions(self, tmp_path):
+        """Test events of the old single calendar_events table (keyed by UID) are migrated on init"""
+        import sqlite3
+        from sqlalchemy import inspect
+        path = tmp_path / "legacy.db"
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE calendar_events (calendar_id VARCHAR PRIMARY KEY, client_id VARCHAR, "
+                     "agent_id VARCHAR, summary VARCHAR, description VARCHAR, start_time DATETIME, end_time DATETIME)")
+        conn.executemany("INSERT INTO calendar_events VALUES (?, '123', '456', ?, '', ?, ?)", [
+            ("jan", "jan", "2025-01-31 22:00:00.000000", "2025-02-01 02:00:00.000000"),
+            ("mar", "mar", "2025-03-03 09:00:00.000000", "2025-03-03 10:00:00.000000"),
+        ])
+        conn.commit()
+        conn.close()
+
+        dal.dispose_db()
+        try:
+            dal.init_db(f"sqlite:///{path}")
+            events = dal.get_agent_events("123", "456", day(2, 1, 0), day(4, 1, 0))
+            assert [(event.calendar_id, event.start_time) for event in events] == [
+                ("jan", day(1, 31, 22)), ("mar", day(3, 3))]
+            assert not inspect(dal.engine).has_table("calendar_events")
+
+            # UIDs are now unique per agent, so a shared feed event merges into another agent
+            assert dal.merge_events_to_db("123", "789", [feed_event("mar", day(3, 3), day(3, 3, 10))]) == 1
+        finally:
+            dal.dispose_db()
@@ -0,0 +1,96 @@
+import os
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("icalendar")
+pytest.importorskip("schedule")
+
+from datetime import datetime, timezone
+from App import metrics
+from App.dal import calendar as dal
+from App.jobs.calendar_sync import CalendarSyncQueue, group_feeds
+
+CALENDAR_PATH = os.path.join(os.path.dirname(__file__), "data", "test_calendar.ics")
+WIDE = (datetime(2000, 1, 1, tzinfo=timezone.utc), datetime(2100, 1, 1, tzinfo=timezone.utc))
+
+
+def agent(agent_id, calendar_url=CALENDAR_PATH):
+    return {"client_id": "123", "agent_id": agent_id, "calendar_url": calendar_url, "last_sync": None}
+
+
+@pytest.fixture
+def db(tmp_path):
+    dal.dispose_db()
+    dal.init_db(f"sqlite:///{tmp_path / 'calendar.db'}")
+    yield
+    dal.dispose_db()
+
+
+def event_counts():
+    counts = {}
+    for batch in dal.iter_agent_events("123", None, *WIDE):
+        for row in batch:
+            counts[row.agent_id] = counts.get(row.agent_id, 0) + 1
+    return counts
+
+
+class TestGroupFeeds:
+    def test_agents_sharing_a_feed_are_grouped(self, tmp_path):
+        """Test agents on the same feed, or on feeds with identical content, share one task"""
+        copy = tmp_path / "copy.ics"
+        with open(CALENDAR_PATH, "rb") as f:
+            copy.write_bytes(f.read())
+        other = tmp_path / "other.ics"
+        other.write_bytes(b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n")
+
+        feeds = group_feeds([agent("a"), agent("b"), agent("c", str(copy)), agent("d", str(other))])
+
+        assert [[a["agent_id"] for a in feed["agents"]] for feed in feeds] == [["a", "b", "c"], ["d"]]
+        assert len({feed["digest"] for feed in feeds}) == 2
+
+    def test_unchanged_and_unreadable_feeds_are_skipped(self, tmp_path):
+        """Test agents whose feed digest is unchanged, or whose feed can't be read, are not queued"""
+        first = group_feeds([agent("a")])[0]
+        unchanged = agent("a")
+        unchanged["feed_digest"] = first["digest"]
+        before = metrics.calendar_sync_feeds_total._values.get(("unchanged",), 0)
+
+        feeds = group_feeds([unchanged, agent("b"), agent("c", str(tmp_path / "missing.ics"))])
+
+        assert [[a["agent_id"] for a in feed["agents"]] for feed in feeds] == [["b"]]
+        assert metrics.calendar_sync_feeds_total._values[("unchanged",)] == before + 1
+
+
+class TestConsumer:
+    def test_shared_feed_fans_out_to_each_agent(self, db):
+        """Test one queued feed is parsed once and merged into every agent using it"""
+        agents = [agent("a"), agent("b")]
+        sync_queue = CalendarSyncQueue(num_consumers=1)
+        sync_queue.start_consumers()
+        try:
+            for feed in group_feeds(agents):
+                sync_queue.task_queue.put(feed)
+            sync_queue.task_queue.join()
+        finally:
+            sync_queue.stop_consumers()
+
+        counts = event_counts()
+        assert counts["a"] == counts["b"] > 0
+        assert agents[0]["feed_digest"] == agents[1]["feed_digest"]
+        # Next cycle: nothing changed, nothing queued
+        assert group_feeds(agents) == []
+
+    def test_unparseable_feed_counts_errors(self, db):
+        """Test a feed that fails to parse counts a sync error for each agent using it"""
+        agents = [agent("a"), agent("b")]
+        before = metrics.calendar_sync_total._values.get(("error",), 0)
+        sync_queue = CalendarSyncQueue(num_consumers=1)
+        sync_queue.start_consumers()
+        try:
+            sync_queue.task_queue.put({"data": b"not a calendar", "digest": "0" * 64, "agents": agents})
+            sync_queue.task_queue.join()
+        finally:
+            sync_queue.stop_consumers()
+
+        assert metrics.calendar_sync_total._values[("error",)] == before + 2
+        assert all("feed_digest" not in a for a in agents)
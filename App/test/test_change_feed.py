@@ -0,0 +1,153 @@
+import asyncio
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("icalendar")
+
+from App.api import change_feed as feed_module
+from App.api.change_feed import ChangeFeed, Subscription, replay_changes
+from App.dal import calendar as dal
+
+
+def utc(hour, minute=0):
+    return datetime(2025, 2, 17, hour, minute, tzinfo=timezone.utc)
+
+
+def change(id, agent_id="456", start=None, end=None, client_id="123"):
+    return SimpleNamespace(id=id, client_id=client_id, agent_id=agent_id,
+                           range_start=start or utc(9), range_end=end or utc(10))
+
+
+class TestSubscription:
+    def test_matches_agents_and_window(self):
+        """Test only the subscribed client's agents and changes overlapping the window match"""
+        subscription = Subscription("123", ["456", "789"], utc(10), utc(12))
+
+        assert subscription.matches(change(1, start=utc(11), end=utc(13)))
+        assert subscription.matches(change(1, agent_id="789", start=utc(9), end=utc(10, 30)))
+        assert not subscription.matches(change(1, agent_id="000", start=utc(11), end=utc(12)))
+        assert not subscription.matches(change(1, client_id="999", start=utc(11), end=utc(12)))
+        assert not subscription.matches(change(1, start=utc(9), end=utc(10)))
+        assert not subscription.matches(change(1, start=utc(12), end=utc(13)))
+
+    def test_overflow_ends_stream(self, monkeypatch):
+        """Test a subscriber that falls behind gets an end-of-stream marker and no more changes"""
+        monkeypatch.setattr(feed_module, "SUBSCRIPTION_QUEUE_SIZE", 2)
+        subscription = Subscription("123", ["456"])
+        for id in range(1, 5):
+            subscription.put(change(id))
+
+        assert subscription.overflowed
+        assert [subscription.queue.get_nowait().id, subscription.queue.get_nowait()] == [2, None]
+        assert subscription.queue.empty()
+
+
+class TestChangeFeed:
+    def test_holds_at_gap_until_it_commits(self):
+        """Test a lower id committing late is still delivered, in order"""
+        feed = ChangeFeed(poll_seconds=1, gap_seconds=10)
+        subscription = Subscription("123", ["456"])
+        feed.subscriptions.add(subscription)
+
+        feed.deliver([change(1), change(2), change(4)], now=0)
+        assert feed.last_id == 2
+        feed.deliver([change(3), change(4)], now=5)
+        assert feed.last_id == 4
+        assert [subscription.queue.get_nowait().id for _ in range(4)] == [1, 2, 3, 4]
+
+    def test_skips_gap_after_timeout(self):
+        """Test a gap left by a rolled back transaction is skipped after gap_seconds"""
+        feed = ChangeFeed(poll_seconds=1, gap_seconds=10)
+        feed.deliver([change(2)], now=0)
+        assert feed.last_id == 0
+        feed.deliver([change(2)], now=9)
+        assert feed.last_id == 0
+        feed.deliver([change(2), change(3)], now=10)
+        assert feed.last_id == 3
+
+    def test_concurrent_subscribers_share_one_poller(self, monkeypatch):
+        """Test subscribers arriving together start a single poller"""
+        calls = []
+
+        def latest_change_id(settled_seconds):
+            calls.append(settled_seconds)
+            return 7
+        monkeypatch.setattr(feed_module, "get_latest_change_id", latest_change_id)
+        monkeypatch.setattr(feed_module, "get_changes_since", lambda since_id: [])
+
+        async def run():
+            feed = ChangeFeed(poll_seconds=0.01, gap_seconds=10)
+            first, second = Subscription("123", ["456"]), Subscription("123", ["789"])
+            live_from = await asyncio.gather(feed.subscribe(first), feed.subscribe(second))
+            task = feed._task
+            feed.unsubscribe(first)
+            feed.unsubscribe(second)
+            await task
+            return live_from
+
+        assert asyncio.run(run()) == [7, 7]
+        assert calls == [10]
+
+
+@pytest.fixture
+def db(tmp_path):
+    dal.dispose_db()
+    dal.init_db(f"sqlite:///{tmp_path / 'calendar.db'}")
+    yield
+    dal.dispose_db()
+
+
+def feed_event(calendar_id, start_time, end_time):
+    return {"calendar_id": calendar_id, "summary": calendar_id, "description": "",
+            "start_time": start_time, "end_time": end_time}
+
+
+class TestReplayChanges:
+    def test_replays_matching_changes_up_to_live_id(self, db):
+        """Test replay covers (since_id, until_id] for the subscription, so live changes aren't repeated"""
+        for i in range(4):
+            dal.merge_events_to_db("123", "456", [feed_event(f"e{j}", utc(9 + 2 * j), utc(10 + 2 * j))
+                                                  for j in range(i + 1)])
+        dal.merge_events_to_db("123", "789", [feed_event("other", utc(9), utc(10))])
+        subscription = Subscription("123", ["456"], utc(10, 30), utc(16))
+
+        async def replay(since_id, until_id):
+            return [change.calendar_id async for change in
+                    replay_changes(subscription, since_id, until_id, batch_size=2)]
+
+        assert asyncio.run(replay(0, dal.get_latest_change_id())) == ["e1", "e2", "e3"]
+        assert asyncio.run(replay(1, 3)) == ["e1", "e2"]
+
+
+class EndAfterReplay(Subscription):
+    """Subscription whose live stream ends right away, so the response completes after the replay"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queue.put_nowait(None)
+
+
+class TestChangeStream:
+    def test_resumes_from_last_event_id(self, db, monkeypatch):
+        """Test a reconnecting client gets the changes after its Last-Event-ID as server-sent events"""
+        from fastapi.testclient import TestClient
+        from App.api import agent_schedule
+        from App.router import app
+
+        dal.merge_events_to_db("123", "456", [feed_event("a", utc(9), utc(10))])
+        dal.merge_events_to_db("123", "456", [feed_event("a", utc(9), utc(10)), feed_event("b", utc(11), utc(12))])
+        dal.merge_events_to_db("123", "456", [feed_event("b", utc(11), utc(12))])
+        # gap_seconds=0 treats everything logged as settled, so the replay covers it all
+        monkeypatch.setattr(agent_schedule, "change_feed", ChangeFeed(poll_seconds=0.01, gap_seconds=0))
+        monkeypatch.setattr(agent_schedule, "Subscription", EndAfterReplay)
+
+        response = TestClient(app).get("/api/v1/agent-schedule/changes/stream",
+                                       params={"client_id": "123", "agent_ids": ["456"]},
+                                       headers={"Last-Event-ID": "1"})
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        lines = response.text.splitlines()
+        assert [line for line in lines if line.startswith("id:")] == ["id: 2", "id: 3"]
+        assert '"calendar_id": "b", "change_type": "inserted"' in response.text
+        assert '"calendar_id": "a", "change_type": "deleted"' in response.text
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from App.free_time import clip_gaps, free_gaps, slots_from_gaps
+
+
+def utc(hour, minute=0):
+    return datetime(2024, 3, 1, hour, minute, tzinfo=timezone.utc)
+
+
+class TestFreeGaps:
+    def test_no_busy(self):
+        """Test the whole range is free when nothing is busy"""
+        assert free_gaps([], utc(9), utc(17)) == [(utc(9), utc(17))]
+
+    def test_gaps_between_busy(self):
+        """Test overlapping, unsorted busy intervals and intervals outside the range"""
+        busy = [
+            (utc(11), utc(12)),
+            (utc(8), utc(9, 30)),      # starts before the range
+            (utc(11, 30), utc(12, 30)),  # overlaps the previous one
+            (utc(16, 30), utc(18)),    # ends after the range
+            (utc(19), utc(20)),        # after the range
+        ]
+        assert free_gaps(busy, utc(9), utc(17)) == [
+            (utc(9, 30), utc(11)),
+            (utc(12, 30), utc(16, 30)),
+        ]
+
+    def test_fully_busy(self):
+        """Test no gaps when a busy interval covers the range"""
+        assert free_gaps([(utc(8), utc(18))], utc(9), utc(17)) == []
+
+
+class TestSlotsFromGaps:
+    def test_pack_slots(self):
+        """Test slots are packed back-to-back and skip gaps that are too short"""
+        gaps = [(utc(9), utc(9, 20)), (utc(10), utc(11)), (utc(12), utc(12, 45))]
+        slots = slots_from_gaps(gaps, 30, limit=4)
+        assert [(slot["start"], slot["end"]) for slot in slots] == [
+            (utc(10), utc(10, 30)),
+            (utc(10, 30), utc(11)),
+            (utc(12), utc(12, 30)),
+        ]
+        assert all(slot["duration_minutes"] == 30 for slot in slots)
+
+    def test_respect_limit(self):
+        """Test that the function respects the slot limit"""
+        assert len(slots_from_gaps([(utc(9), utc(17))], 30, limit=3)) == 3
+
+    def test_clip_to_start_time(self):
+        """Test free time before start_time is ignored"""
+        gaps = [(utc(9), utc(10, 10)), (utc(11), utc(12))]
+        slots = slots_from_gaps(gaps, 30, limit=3, start_time=utc(9, 45))
+        assert [slot["start"] for slot in slots] == [utc(11), utc(11, 30)]
+
+
+class TestClipGaps:
+    def test_clip_to_window(self):
+        """Test gaps are trimmed to the window and gaps outside it dropped"""
+        gaps = [(utc(8), utc(9)), (utc(9, 30), utc(11)), (utc(12), utc(14)), (utc(15), utc(16))]
+        assert clip_gaps(gaps, utc(10), utc(13)) == [(utc(10), utc(11)), (utc(12), utc(13))]
@@ -0,0 +1,52 @@
+import pytest
+from App.metrics import Counter, Gauge, Histogram, Registry, track_queries, current_query_stats
+
+
+class TestMetrics:
+    def test_counter_render(self):
+        """Test counters render one sample per label set"""
+        registry = Registry()
+        counter = registry.register(Counter("requests_total", "Requests", ("path",)))
+        counter.inc(path="/a")
+        counter.inc(2, path="/a")
+        counter.inc(path="/b")
+
+        text = registry.render()
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{path="/a"} 3' in text
+        assert 'requests_total{path="/b"} 1' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets accumulate and include +Inf, sum and count"""
+        histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        text = histogram.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="1.0"} 2' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+        assert "latency_seconds_sum 5.55" in text
+        assert "latency_seconds_count 3" in text
+
+    def test_gauge_function(self):
+        """Test gauges evaluate registered functions at render time"""
+        depth = [4]
+        gauge = Gauge("queue_depth", "Depth")
+        gauge.set_function(lambda: depth[0])
+        depth[0] = 7
+        assert "queue_depth 7" in gauge.render()
+
+    def test_duplicate_registration(self):
+        """Test registering the same metric name twice fails"""
+        registry = Registry()
+        registry.register(Counter("dup_total", "Dup"))
+        with pytest.raises(ValueError):
+            registry.register(Counter("dup_total", "Dup"))
+
+    def test_track_queries_scope(self):
+        """Test query stats are only active inside the tracking block"""
+        with track_queries() as stats:
+            assert current_query_stats.get() is stats
+        assert current_query_stats.get() is None
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from collections import Counter
+from App.profiling import ProfileStore, StackSampler, profile_mode, render_folded, save_profile
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestProfileMode:
+    def test_true_values_save(self):
+        """Test true flag values save the profile and "return" returns it"""
+        assert [profile_mode(value) for value in ("1", "true", "Yes", "on")] == ["save"] * 4
+        assert profile_mode("return") == "return"
+
+    def test_false_values_disable(self):
+        """Test false, empty or missing flags leave profiling off"""
+        assert [profile_mode(value) for value in (None, "", "0", "false", "off", "no")] == [None] * 6
+
+
+class TestStackSampler:
+    def test_samples_target_thread(self):
+        """Test the sampler records stacks of the thread it was started for"""
+        sampler = StackSampler(interval_ms=1).start()
+        busy_wait(0.05)
+        stacks = sampler.stop()
+
+        assert sampler.samples > 0
+        assert sum(stacks.values()) == sampler.samples
+        assert any("busy_wait (test_profiling.py" in stack for stack in stacks)
+
+    def test_stop_ends_thread(self):
+        """Test stop joins the sampling thread"""
+        sampler = StackSampler(thread_id=threading.get_ident(), interval_ms=1).start()
+        sampler.stop()
+        assert not sampler._thread.is_alive()
+
+
+class TestRenderFolded:
+    def test_most_common_first_with_root(self):
+        """Test folded lines are ordered by count and prefixed with the root frame"""
+        stacks = Counter({"a;b": 1, "a;c": 3})
+        assert render_folded(stacks) == "a;c 3\na;b 1\n"
+        assert render_folded(stacks, root="GET /x;y") == "GET /x:y;a;c 3\nGET /x:y;a;b 1\n"
+
+
+class TestProfileStore:
+    def test_should_sample_one_in_n(self):
+        """Test every Nth request is sampled and 0 disables sampling"""
+        store = ProfileStore()
+        assert [store.should_sample(3) for _ in range(6)] == [False, False, True, False, False, True]
+        assert not any(store.should_sample(0) for _ in range(5))
+
+    def test_aggregates_per_route(self):
+        """Test stacks are summed per route and can be filtered and cleared"""
+        store = ProfileStore()
+        store.add("GET /a", Counter({"f;g": 1}))
+        store.add("GET /a", Counter({"f;g": 2}))
+        store.add("GET /b", Counter({"h": 1}))
+
+        assert store.render("GET /a") == "GET /a;f;g 3\n"
+        assert "GET /b;h 1\n" in store.render()
+        store.clear()
+        assert store.render() == ""
+
+
+class TestSaveProfile:
+    def test_writes_folded_file(self, tmp_path):
+        """Test profiles are saved as folded files named after the route"""
+        path = save_profile(Counter({"a;b": 2}), str(tmp_path / "profiles"), "GET /api/v1/x")
+
+        assert os.path.dirname(path) == str(tmp_path / "profiles")
+        assert path.endswith("-GET_api_v1_x.folded")
+        with open(path) as f:
+            assert f.read() == "a;b 2\n"
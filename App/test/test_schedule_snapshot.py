@@ -0,0 +1,68 @@
+import os
+from datetime import datetime, timezone
+from App.dal.snapshot import SnapshotReader, write_snapshot
+
+
+def utc(day, hour, minute=0):
+    return datetime(2025, 2, day, hour, minute, tzinfo=timezone.utc)
+
+
+HORIZON = (utc(1, 0), utc(28, 0))
+
+
+class TestScheduleSnapshot:
+    def test_busy_intervals(self, tmp_path):
+        """Test lookups return each event overlapping the window for the right agent"""
+        path = str(tmp_path / "calendar.snapshot")
+        write_snapshot(path, {
+            ("123", "456"): [
+                (utc(17, 13), utc(17, 14)),
+                (utc(17, 6), utc(17, 10, 30)),
+                (utc(17, 9), utc(17, 10)),
+                (utc(17, 9, 30), utc(17, 11)),
+                (utc(18, 9), utc(18, 10)),
+            ],
+            ("123", "789"): [(utc(17, 9), utc(17, 17))],
+        }, *HORIZON)
+        reader = SnapshotReader(path)
+
+        # The long early event is found although later-starting events end before the window
+        assert reader.busy_intervals("123", "456", utc(17, 10), utc(17, 13, 30)) == [
+            (utc(17, 6), utc(17, 10, 30)),
+            (utc(17, 9, 30), utc(17, 11)),
+            (utc(17, 13), utc(17, 14)),
+        ]
+        assert reader.busy_intervals("123", "456", utc(17, 11), utc(17, 13)) == []
+        assert reader.busy_intervals("123", "unknown", utc(17, 9), utc(17, 17)) == []
+
+    def test_outside_horizon(self, tmp_path):
+        """Test windows the snapshot does not cover fall back to the database"""
+        path = str(tmp_path / "calendar.snapshot")
+        write_snapshot(path, {}, *HORIZON)
+        reader = SnapshotReader(path)
+
+        assert reader.busy_intervals("123", "456", utc(27, 23), utc(28, 1)) is None
+        assert SnapshotReader(str(tmp_path / "missing.snapshot")).busy_intervals(
+            "123", "456", utc(17, 9), utc(17, 10)) is None
+
+    def test_atomic_swap(self, tmp_path):
+        """Test readers pick up a republished snapshot"""
+        path = str(tmp_path / "calendar.snapshot")
+        write_snapshot(path, {("123", "456"): [(utc(17, 9), utc(17, 10))]}, *HORIZON)
+        reader = SnapshotReader(path, check_interval=0)
+        assert reader.busy_intervals("123", "456", utc(17, 9), utc(17, 10)) != []
+
+        write_snapshot(path, {}, *HORIZON)
+        assert reader.busy_intervals("123", "456", utc(17, 9), utc(17, 10)) == []
+        assert os.listdir(tmp_path) == ["calendar.snapshot"]
+
+    def test_stale_after_newer_changes(self, tmp_path):
+        """Test the snapshot is bypassed once the change log moves past it"""
+        path = str(tmp_path / "calendar.snapshot")
+        write_snapshot(path, {}, *HORIZON, change_id=5)
+        latest = [5]
+        reader = SnapshotReader(path, check_interval=0, latest_change_id=lambda: latest[0])
+        assert reader.busy_intervals("123", "456", utc(17, 9), utc(17, 10)) == []
+
+        latest[0] = 6
+        assert reader.busy_intervals("123", "456", utc(17, 9), utc(17, 10)) is None